@@ -1,6 +1,11 @@
 #config_request.py
 
-from pydantic import BaseModel
+import os
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+# Upper bound on the per-batch concurrency a client may ask for
+BATCH_MAX_CONCURRENCY = int(os.getenv("NOA_BATCH_MAX_CONCURRENCY", "64"))
 
 class ConfigRequest(BaseModel):
     vendor: str
@@ -10,4 +15,7 @@ class ConfigRequest(BaseModel):
     parameters: str
     device_ip: str
     device_name: str
-	
+
+class ConfigBatchRequest(BaseModel):
+    requests: List[ConfigRequest]
+    concurrency: Optional[int] = Field(default=None, ge=1, le=BATCH_MAX_CONCURRENCY)
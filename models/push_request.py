@@ -0,0 +1,8 @@
+#push_request.py
+
+from typing import List, Optional
+from pydantic import BaseModel
+
+class PushBatchRequest(BaseModel):
+    request_ids: List[int]
+    timeout: Optional[float] = None
@@ -1,87 +1,200 @@
 #parse_cli_file.py
-   
-import sqlite3
+
+import argparse
+import hashlib
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.cli_blocks import CLI_EXTENSIONS, iter_blocks, make_row
+from utils.database import content_hash, get_connection, init_library_db
+from utils.vector_index import index_path_for, update_index
+
+INSERT_SQL = """
+    INSERT OR IGNORE INTO cli_library (vendor, model, os_version, feature, cli_block, source, content_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+# Rows ingested from a file also record its absolute path (the manifest
+# key), which is what the section diff and the cleanup of removed files go by
+INSERT_FROM_FILE_SQL = """
+    INSERT OR IGNORE INTO cli_library (vendor, model, os_version, feature, cli_block, source, content_hash, source_path)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+FILE_BLOCKS_SQL = "SELECT id, content_hash FROM cli_library WHERE source_path = ?"
 
 def init_db(db_path="cli_library.db"):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS cli_library (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        vendor TEXT,
-        model TEXT,
-        os_version TEXT,
-        feature TEXT,
-        cli_block TEXT,
-        source TEXT
-    );
-    """)
-    conn.commit()
-    conn.close()
+    init_library_db(db_path)
 
 def entry_exists(vendor, model, os_version, feature, cli_block, db_path="cli_library.db"):
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(*) FROM cli_library
-        WHERE vendor = ? AND model = ? AND os_version = ? AND feature = ? AND cli_block = ?
-    """, (vendor, model, os_version, feature, cli_block.strip()))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count > 0
+    cursor.execute(
+        "SELECT 1 FROM cli_library WHERE content_hash = ?",
+        (content_hash(vendor, model, os_version, feature, cli_block),)
+    )
+    return cursor.fetchone() is not None
 
 def insert_entry(vendor, model, os_version, feature, cli_block, source, db_path="cli_library.db"):
-    if not entry_exists(vendor, model, os_version, feature, cli_block, db_path):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT INTO cli_library (vendor, model, os_version, feature, cli_block, source)
-        VALUES (?, ?, ?, ?, ?, ?);
-        """, (vendor, model, os_version, feature, cli_block.strip(), source))
-        conn.commit()
-        conn.close()
-
-def parse_cli_file(file_path):
-    source = os.path.basename(file_path)
-    filename = source.replace(".cli", "").replace(".txt", "")
-    parts = filename.split("_")
-
-    vendor = parts[0].capitalize() if len(parts) > 0 else "Unknown"
-    model = parts[1].upper() if len(parts) > 1 else "Unknown"
-    os_version = parts[2].upper() if len(parts) > 2 else "Unknown"
-
-    with open(file_path, "r") as f:
-        lines = f.readlines()
-
-    current_feature = None
-    current_block = []
-
-    for line in lines:
-        if line.startswith("###"):
-            if current_feature and current_block:
-                cli_block = "\n".join(current_block)
-                insert_entry(vendor, model, os_version, current_feature, cli_block, source)
-            current_block = []
-            current_feature = line.strip().replace("###", "").strip()
-        else:
-            current_block.append(line.rstrip())
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(INSERT_SQL, make_row(vendor, model, os_version, feature, cli_block, source))
+
+def parse_blocks(file_path):
+    return list(iter_blocks(file_path))
+
+def ingest_rows(conn, rows, source_path=None):
+    # rowcount sums direct inserts only, ignored duplicates and trigger writes are not counted
+    if source_path is None:
+        return conn.executemany(INSERT_SQL, rows).rowcount
+    return conn.executemany(INSERT_FROM_FILE_SQL, [row + (source_path,) for row in rows]).rowcount
+
+def parse_cli_file(file_path, db_path="cli_library.db"):
+    conn = get_connection(db_path)
+    with conn:
+        return ingest_rows(conn, iter_blocks(file_path), os.path.abspath(file_path))
+
+def find_cli_files(path):
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(path)
+        for name in names
+        if name.endswith(CLI_EXTENSIONS)
+    )
 
-    if current_feature and current_block:
-        cli_block = "\n".join(current_block)
-        insert_entry(vendor, model, os_version, current_feature, cli_block, source)
+def file_fingerprint(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(conn):
+    cursor = conn.execute("SELECT path, size, mtime_ns, content_hash FROM ingestion_manifest")
+    return {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+
+def scan_file(file_path, known_hash=None):
+    # Runs in a worker: a touched file whose bytes did not change is not re-parsed
+    stat = os.stat(file_path)
+    file_hash = file_fingerprint(file_path)
+    rows = None if file_hash == known_hash else parse_blocks(file_path)
+    return file_path, stat.st_size, stat.st_mtime_ns, file_hash, rows
+
+def apply_file_diff(conn, rows, source_path):
+    # Section-level diff against what this file contributed last time: blocks
+    # whose hash disappeared are deleted, new hashes are inserted, the rest
+    # are left alone. A modified section shows up as one of each. Rows stored
+    # before paths were recorded are adopted by the file that has them.
+    existing = {row[1]: row[0] for row in conn.execute(FILE_BLOCKS_SQL, (source_path,)).fetchall()}
+    new_hashes = {row[-1] for row in rows}
+    removed = [block_id for block_hash, block_id in existing.items() if block_hash not in new_hashes]
+    if removed:
+        conn.executemany("DELETE FROM cli_library WHERE id = ?", [(block_id,) for block_id in removed])
+    added = ingest_rows(conn, [row for row in rows if row[-1] not in existing], source_path)
+    conn.executemany(
+        "UPDATE cli_library SET source_path = ? WHERE content_hash = ? AND source_path IS NULL",
+        [(source_path, block_hash) for block_hash in new_hashes - existing.keys()]
+    )
+    return added, removed
+
+def remove_files(conn, paths):
+    # Files ingested before that no longer exist take their blocks with them
+    removed = []
+    for path in paths:
+        removed.extend(row[0] for row in conn.execute(FILE_BLOCKS_SQL, (path,)).fetchall())
+        conn.execute("DELETE FROM cli_library WHERE source_path = ?", (path,))
+        conn.execute("DELETE FROM ingestion_manifest WHERE path = ?", (path,))
+    return removed
+
+def ingest_paths(paths, db_path="cli_library.db", workers=None, force=False):
+    # Unchanged files are skipped from the manifest by size and mtime alone.
+    # The rest are fingerprinted and parsed in a process pool; SQLite has a
+    # single writer, so every diff is applied from this process inside one
+    # transaction.
+    start = time.perf_counter()
+    stats = {"files": len(paths), "skipped": 0, "changed": 0, "blocks": 0,
+             "inserted": 0, "removed": 0, "removed_ids": [], "missing": 0}
+    conn = get_connection(db_path)
+    manifest = load_manifest(conn)
+    # Without a manifest the removals below say nothing about what the
+    # vector index holds, it has to compare against the live ids
+    stats["fresh"] = not manifest
+    # Before any diff, so a file that moved is removed under its old path
+    # and then re-inserted under the new one
+    missing = [path for path in manifest if not os.path.exists(path)]
+    with conn:
+        removed = remove_files(conn, missing)
+    stats["missing"] = len(missing)
+    stats["removed"] += len(removed)
+    stats["removed_ids"].extend(removed)
+    if force:
+        manifest = {}
+
+    candidates = []
+    for path in paths:
+        known = manifest.get(os.path.abspath(path))
+        stat = os.stat(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            stats["skipped"] += 1
+            continue
+        candidates.append((path, known[2] if known else None))
+
+    with conn:
+        if workers == 1 or len(candidates) <= 1:
+            results = (scan_file(path, known_hash) for path, known_hash in candidates)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            futures = [pool.submit(scan_file, path, known_hash) for path, known_hash in candidates]
+            results = (future.result() for future in as_completed(futures))
+        try:
+            for path, size, mtime_ns, file_hash, rows in results:
+                if rows is None:
+                    stats["skipped"] += 1
+                else:
+                    added, removed = apply_file_diff(conn, rows, os.path.abspath(path))
+                    stats["changed"] += 1
+                    stats["blocks"] += len(rows)
+                    stats["inserted"] += added
+                    stats["removed"] += len(removed)
+                    stats["removed_ids"].extend(removed)
+                conn.execute("""
+                    INSERT OR REPLACE INTO ingestion_manifest (path, size, mtime_ns, content_hash, blocks, ingested_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (os.path.abspath(path), size, mtime_ns, file_hash,
+                      len(rows) if rows is not None else None, time.time()))
+        finally:
+            if pool:
+                pool.shutdown()
+    stats["seconds"] = time.perf_counter() - start
+    stats["duplicates"] = stats["blocks"] - stats["inserted"]
+    stats["blocks_per_sec"] = stats["blocks"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python parse_cli_file.py <path_to_cli_file>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Load ### delimited CLI blocks into cli_library.db")
+    parser.add_argument("path", help="a .cli/.txt file or a directory such as cli_files/")
+    parser.add_argument("--db", default="cli_library.db")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="ignore the ingestion manifest and re-check every file")
+    args = parser.parse_args()
 
-    cli_file_path = sys.argv[1]
-    if not os.path.isfile(cli_file_path):
-        print(f"Error: File '{cli_file_path}' does not exist.")
+    if not os.path.exists(args.path):
+        print(f"Error: Path '{args.path}' does not exist.")
         sys.exit(1)
 
-    init_db()
-    parse_cli_file(cli_file_path)
-    print(f"Parsed and inserted CLI blocks from '{cli_file_path}' into cli_library.db")
\ No newline at end of file
+    init_db(args.db)
+    cli_files = find_cli_files(args.path)
+    stats = ingest_paths(cli_files, args.db, args.workers, args.force)
+    print(f"{stats['files']} file(s): {stats['changed']} changed, {stats['skipped']} unchanged, "
+          f"{stats['missing']} previously ingested file(s) gone")
+    print(f"Parsed {stats['blocks']} CLI blocks into {args.db}: "
+          f"{stats['inserted']} new, {stats['removed']} removed, {stats['duplicates']} unchanged or duplicate")
+    print(f"{stats['blocks_per_sec']:.0f} blocks/sec ({stats['seconds']:.2f}s)")
+    # Version triggers on cli_library already told the API's caches; the
+    # vector index file is the one consumer that needs an explicit update
+    if stats["inserted"] or stats["removed"] or not os.path.exists(index_path_for(args.db)):
+        index = update_index(args.db, removed_ids=None if stats["fresh"] else stats["removed_ids"])
+        print(f"Vector index now covers {len(index)} blocks")
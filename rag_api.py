@@ -1,48 +1,123 @@
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, Request, Depends, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 import os
+import asyncio
+import httpx
 import logging
 import json
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Optional
+from urllib.parse import urlencode
 from dotenv import load_dotenv
 
-from models.config_request import ConfigRequest
+from models.config_request import ConfigBatchRequest, ConfigRequest
+from models.push_request import PushBatchRequest
 from utils.database import (
     get_db_connection,
     init_staging_db,
-    store_in_staging_queue,
     init_feedback_db,
+    init_library_db,
+    migrate_staging_db,
+    FEEDBACK_HISTORY_SQL,
+    PAGE_SIZE,
+    STAGING_ROW_SQL,
+    list_requests,
+    status_counts,
     log_feedback
 )
-from utils.device import push_config_to_device
+from utils.device import close_sessions, push_config_to_device
+from utils.batch_generation import BATCH_MAX_ITEMS, generate_batch
+from utils.jobs import enqueue_job, generation_workers, get_job
+from utils.push_engine import create_push_batch, get_push_batch, run_push_batch
 from utils.query import query_weighted_entries
-from utils.ollama import build_prompt, call_ollama
+from utils.metadata_index import get_metadata_index
+from utils.ollama import (
+    CliBlockExtractor,
+    build_prompt,
+    call_ollama,
+    close_client,
+    feedback_prompt,
+    generation_failed,
+    generation_flights,
+    llm_router,
+    select_examples,
+    stream_ollama
+)
+from utils.prompt import prompt_reference
+from utils.cache import generation_cache
+from utils.llm_router import NoBackendAvailable
+from utils.logs import configure_logging, log_body
+from utils.metrics import MetricsMiddleware, render_metrics
+from utils.validation import VALIDATION_MODE, get_grammars, validate_config, validation_error
 from auth.authentication import authenticate
 
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(get_metadata_index)
+    await run_in_threadpool(get_grammars)
+    generation_workers.start()
+    yield
+    await generation_workers.stop()
+    await close_client()
+    await run_in_threadpool(close_sessions)
+
 # Initialize FastAPI app and templates
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 templates = Jinja2Templates(directory="templates")
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("noa.log"),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: non-blocking queue to a rotated noa.log, see utils/logs.py
+configure_logging()
 logger = logging.getLogger("rag_api")
 
 # Initialize databases
 init_staging_db()
 init_feedback_db()
+migrate_staging_db()
+init_library_db()
+
+DISCONNECT_POLL_INTERVAL = 1.0
 
-@app.post("/webhook")
-def handle_webhook(payload: dict, user: str = Depends(authenticate)):
-    logger.info("Received webhook payload:\n%s", json.dumps(payload, indent=2))
+async def generate_unless_disconnected(request: Request, config_request, prompt):
+    # Abandon the Ollama call as soon as the HTTP client goes away
+    task = asyncio.ensure_future(call_ollama(prompt, vendor=config_request.vendor, feature=config_request.feature, model=config_request.model))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling generation")
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected.")
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def generate_cached(request: Request, config_request, entries, prompt):
+    key = await run_in_threadpool(generation_cache.key_for, config_request, select_examples(entries))
+    cached = await run_in_threadpool(generation_cache.get, key)
+    if cached is not None:
+        logger.info("Generation cache hit")
+        return cached
+    generated_config = await generate_unless_disconnected(request, config_request, prompt)
+    if not generation_failed(generated_config):
+        await run_in_threadpool(generation_cache.set, key, generated_config)
+    return generated_config
+
+@app.post("/webhook", status_code=202)
+async def handle_webhook(payload: dict, user: str = Depends(authenticate)):
+    log_body(logger, "Received webhook payload", json.dumps(payload))
+    # A client error, checked before the catch-all below turns it into a 500
+    try:
+        priority = int(payload.get("priority", 0))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail=f"priority must be an integer, got {payload.get('priority')!r}.")
     try:
         device = payload.get("device", {})
         config_request = ConfigRequest(
@@ -54,33 +129,33 @@ def handle_webhook(payload: dict, user: str = Depends(authenticate)):
             device_ip=payload.get("device_ip", ""),
             device_name=payload.get("device_name", "")
         )
-        entries = query_weighted_entries(
-            vendor=config_request.vendor,
-            model=config_request.model,
-            os_version=config_request.os_version,
-            feature=config_request.feature
-        )
-        if not entries:
-            raise HTTPException(status_code=404, detail="No CLI examples found.")
-        prompt = build_prompt(entries, config_request)
-        generated_config = call_ollama(prompt)
-        store_in_staging_queue(config_request, generated_config)
+        job_id = await run_in_threadpool(enqueue_job, config_request, priority)
+        generation_workers.notify()
         return {
+            "job_id": job_id,
             "status": "queued",
+            "status_url": f"/webhook/{job_id}",
             "vendor": config_request.vendor,
             "model": config_request.model,
             "feature": config_request.feature,
             "device_ip": config_request.device_ip,
-            "device_name": config_request.device_name,
-            "generated_config": generated_config
+            "device_name": config_request.device_name
         }
     except Exception as e:
         logger.error(f"Webhook processing failed: {e}")
         raise HTTPException(status_code=500, detail="Webhook processing failed.")
 
+@app.get("/webhook/{job_id}")
+def webhook_status(job_id: int, user: str = Depends(authenticate)):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
 @app.post("/generate-config")
-def generate_config(request: ConfigRequest, user: str = Depends(authenticate)):
-    entries = query_weighted_entries(
+async def generate_config(request: ConfigRequest, http_request: Request, user: str = Depends(authenticate)):
+    entries = await run_in_threadpool(
+        query_weighted_entries,
         vendor=request.vendor,
         model=request.model,
         os_version=request.os_version,
@@ -89,39 +164,147 @@ def generate_config(request: ConfigRequest, user: str = Depends(authenticate)):
     if not entries:
         raise HTTPException(status_code=404, detail="No CLI examples found.")
     prompt = build_prompt(entries, request)
-    response = call_ollama(prompt)
+    response = await generate_cached(http_request, request, entries, prompt)
     return {"generated_config": response}
 
+@app.post("/generate-config/batch")
+async def generate_config_batch(batch: ConfigBatchRequest, user: str = Depends(authenticate)):
+    # NDJSON, one line per item as it finishes and a summary line with the
+    # staging_queue ids once the batch is stored
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="No requests given.")
+    if len(batch.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} requests per batch.")
+    logger.info(f"{user} submitted a generation batch of {len(batch.requests)} requests")
+
+    async def lines():
+        async for item in generate_batch(batch.requests, batch.concurrency):
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/generate-config/stream")
+async def generate_config_stream(request: ConfigRequest, user: str = Depends(authenticate)):
+    # Server-sent events: "token" for every raw fragment from Ollama, "cli"
+    # for new text inside the CLI block as it is recognised, then "done" with
+    # the final extracted config (or "error"). Starlette stops the generator,
+    # and with it the Ollama stream, when the client disconnects.
+    entries = await run_in_threadpool(
+        query_weighted_entries,
+        vendor=request.vendor,
+        model=request.model,
+        os_version=request.os_version,
+        feature=request.feature
+    )
+    if not entries:
+        raise HTTPException(status_code=404, detail="No CLI examples found.")
+    prompt = build_prompt(entries, request)
+    key = await run_in_threadpool(generation_cache.key_for, request, select_examples(entries))
+    cached = await run_in_threadpool(generation_cache.get, key)
+
+    async def events():
+        if cached is not None:
+            yield sse_event("cli", cached)
+            yield sse_event("done", {"generated_config": cached, "cached": True})
+            return
+        extractor = CliBlockExtractor()
+        try:
+            async for token in stream_ollama(prompt, vendor=request.vendor, feature=request.feature):
+                yield sse_event("token", token)
+                delta = extractor.feed(token)
+                if delta:
+                    yield sse_event("cli", delta)
+        except (httpx.HTTPError, NoBackendAvailable) as e:
+            logger.error(f"Ollama stream failed: {e}")
+            yield sse_event("error", "Error: Unable to reach Ollama.")
+            return
+        log_body(logger, "Ollama response", extractor.text)
+        generated_config = extractor.finish()
+        # Already streamed, so an invalid config is reported rather than
+        # regenerated
+        if VALIDATION_MODE != "off" and not generation_failed(generated_config):
+            problems = validate_config(generated_config, request.vendor, request.model)
+            if problems and VALIDATION_MODE == "enforce":
+                yield sse_event("error", validation_error(problems))
+                return
+            if problems:
+                logger.warning(f"Streamed config failed validation, kept: {'; '.join(problems[:5])}")
+        if not generation_failed(generated_config):
+            await run_in_threadpool(generation_cache.set, key, generated_config)
+        yield sse_event("done", {"generated_config": generated_config, "cached": False})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/cache/stats")
+def cache_stats(user: str = Depends(authenticate)):
+    return {**generation_cache.stats(), "coalescing": generation_flights.stats()}
+
+@app.get("/llm/backends")
+def llm_backends(user: str = Depends(authenticate)):
+    return llm_router.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(user: str = Depends(authenticate)):
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def list_page_context(request: Request, filters, before, after, limit, fixed=None):
+    # Empty form fields arrive as "", they mean no filter. fixed filters are
+    # imposed by the page itself and stay out of the pager links.
+    filters = {name: value for name, value in filters.items() if value}
+    for name in ("since", "until"):
+        if name in filters:
+            try:
+                date.fromisoformat(filters[name])
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"{name} must be a YYYY-MM-DD date.")
+    page = list_requests({**filters, **(fixed or {})}, before, after, limit)
+    return {"request": request, "filters": filters, "filter_query": urlencode({**filters, "limit": limit}), **page}
+
 @app.get("/review", response_class=HTMLResponse)
-def review_page(request: Request, user: str = Depends(authenticate)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM staging_queue WHERE status = 'pending' ORDER BY created_at DESC")
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return templates.TemplateResponse("review.html", {"request": request, "items": items})
+def review_page(
+    request: Request,
+    vendor: Optional[str] = None,
+    device: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+    user: str = Depends(authenticate)
+):
+    filters = {"vendor": vendor, "device": device, "since": since, "until": until}
+    context = list_page_context(request, filters, before, after, limit, fixed={"status": "pending"})
+    return templates.TemplateResponse("review.html", context)
 
 @app.get("/review/{id}", response_class=HTMLResponse)
 def review_detail(id: int, request: Request, user: str = Depends(authenticate)):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM staging_queue WHERE id = ?", (id,))
+    cursor.execute(STAGING_ROW_SQL, (id,))
     row = cursor.fetchone()
-    conn.close()
     if not row:
         raise HTTPException(status_code=404, detail="Request not found")
     item = dict(row)
-    return templates.TemplateResponse("detail.html", {"request": request, "item": item})
+    # Each review decision with the prompt the config was judged against
+    feedback = [
+        {**dict(event), "prompt": feedback_prompt(event["id"])}
+        for event in cursor.execute(FEEDBACK_HISTORY_SQL, (id,)).fetchall()
+    ]
+    return templates.TemplateResponse("detail.html", {"request": request, "item": item, "feedback": feedback})
 
 @app.post("/approve/{id}")
 def approve_request(id: int, user: str = Depends(authenticate)):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM staging_queue WHERE id = ?", (id,))
+    cursor.execute(STAGING_ROW_SQL, (id,))
     row = cursor.fetchone()
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Config request not found.")
+    if row["generated_config"] is None:
+        raise HTTPException(status_code=409, detail=f"Config is not generated yet ({row['status']}).")
     config_text = row["generated_config"]
     device_ip = row["device_ip"]
     device_name = row["device_name"]
@@ -131,38 +314,36 @@ def approve_request(id: int, user: str = Depends(authenticate)):
     password = os.getenv("SSH_PASSWORD")
     success = push_config_to_device(device_ip, username, password, config_text, vendor, model, device_name)
     new_status = "pushed" if success else "error"
-    prompt = build_prompt([row], ConfigRequest(**row))
-    log_feedback(id, new_status, prompt, config_text)
-    cursor.execute("UPDATE staging_queue SET status = ? WHERE id = ?", (new_status, id))
-    conn.commit()
-    conn.close()
+    prompt = prompt_reference([row], ConfigRequest(**row))
+    with conn:
+        log_feedback(id, new_status, prompt, config_text, commit=False)
+        cursor.execute("UPDATE staging_queue SET status = ? WHERE id = ?", (new_status, id))
     return RedirectResponse(url="/review", status_code=303)
 
 @app.post("/reject/{id}")
 def reject_request(id: int, user: str = Depends(authenticate)):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM staging_queue WHERE id = ?", (id,))
+    cursor.execute(STAGING_ROW_SQL, (id,))
     row = cursor.fetchone()
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Config request not found.")
-    prompt = build_prompt([row], ConfigRequest(**row))
-    log_feedback(id, "rejected", prompt, row["generated_config"])
-    cursor.execute("UPDATE staging_queue SET status = 'rejected' WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    prompt = prompt_reference([row], ConfigRequest(**row))
+    with conn:
+        log_feedback(id, "rejected", prompt, row["generated_config"], commit=False)
+        cursor.execute("UPDATE staging_queue SET status = 'rejected' WHERE id = ?", (id,))
     return RedirectResponse(url="/review", status_code=303)
 
 @app.post("/push/{id}")
 def push_config(id: int, user: str = Depends(authenticate)):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM staging_queue WHERE id = ?", (id,))
+    cursor.execute(STAGING_ROW_SQL, (id,))
     row = cursor.fetchone()
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Config request not found.")
+    if row["generated_config"] is None:
+        raise HTTPException(status_code=409, detail=f"Config is not generated yet ({row['status']}).")
     config_text = row["generated_config"]
     vendor = row["vendor"]
     model = row["model"]
@@ -174,19 +355,47 @@ def push_config(id: int, user: str = Depends(authenticate)):
     logger.info(f"Target device: {device_name} ({device_ip})")
     success = push_config_to_device(device_ip, username, password, config_text, vendor, model, device_name)
     new_status = "pushed" if success else "error"
-    prompt = build_prompt([row], ConfigRequest(**row))
-    log_feedback(id, new_status, prompt, config_text)
-    cursor.execute("UPDATE staging_queue SET status = ? WHERE id = ?", (new_status, id))
-    conn.commit()
-    conn.close()
+    prompt = prompt_reference([row], ConfigRequest(**row))
+    with conn:
+        log_feedback(id, new_status, prompt, config_text, commit=False)
+        cursor.execute("UPDATE staging_queue SET status = ? WHERE id = ?", (new_status, id))
     logger.info(f"Push status for request #{id}: {new_status}")
     return RedirectResponse(url="/review", status_code=303)
+
+@app.post("/push-batch", status_code=202)
+def push_batch(batch: PushBatchRequest, background_tasks: BackgroundTasks, user: str = Depends(authenticate)):
+    if not batch.request_ids:
+        raise HTTPException(status_code=400, detail="No request ids given.")
+    batch_id, pushable = create_push_batch(batch.request_ids, user)
+    queued = set(pushable)
+    skipped = [request_id for request_id in dict.fromkeys(batch.request_ids) if request_id not in queued]
+    username = os.getenv("SSH_USERNAME")
+    password = os.getenv("SSH_PASSWORD")
+    logger.info(f"{user} queued push batch #{batch_id} for {len(pushable)} requests, {len(skipped)} skipped")
+    background_tasks.add_task(run_push_batch, batch_id, pushable, username, password, timeout=batch.timeout)
+    return {"batch_id": batch_id, "status": "queued", "skipped": skipped, "progress_url": f"/push-batch/{batch_id}"}
+
+@app.get("/push-batch/{batch_id}")
+def push_batch_status(batch_id: int, user: str = Depends(authenticate)):
+    batch = get_push_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Push batch not found.")
+    return batch
     
 @app.get("/all-requests", response_class=HTMLResponse)
-def all_requests_page(request: Request, user: str = Depends(authenticate)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM staging_queue ORDER BY created_at DESC")
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return templates.TemplateResponse("all_requests.html", {"request": request, "items": items})
\ No newline at end of file
+def all_requests_page(
+    request: Request,
+    status: Optional[str] = None,
+    vendor: Optional[str] = None,
+    device: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+    user: str = Depends(authenticate)
+):
+    filters = {"status": status, "vendor": vendor, "device": device, "since": since, "until": until}
+    context = list_page_context(request, filters, before, after, limit)
+    context["status_counts"] = status_counts()
+    return templates.TemplateResponse("all_requests.html", context)
\ No newline at end of file
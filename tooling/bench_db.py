@@ -0,0 +1,111 @@
+#bench_db.py
+#
+# Write throughput of store_in_staging_queue and log_feedback as writer
+# threads increase, pooled WAL connections vs. a fresh connection per call.
+#   python tooling/bench_db.py --ops 500 --threads 1 2 4 8 16
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from models.config_request import ConfigRequest
+from utils.blobs import put_blob
+from utils.database import (
+    close_connections,
+    init_feedback_db,
+    init_staging_db,
+    log_feedback,
+    migrate_staging_db,
+    store_in_staging_queue
+)
+
+REQUEST = ConfigRequest(
+    vendor="Cisco",
+    model="NEXUS93180",
+    os_version="NXOS-9.3",
+    feature="VLAN",
+    parameters="Create VLAN 30 named IoT",
+    device_ip="10.0.0.1",
+    device_name="bench-sw1"
+)
+CONFIG = "vlan 30\n  name IoT"
+
+def unpooled_store(request, generated_config, db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO staging_queue (
+            vendor, model, os_version, feature, parameters,
+            config_hash, status, device_ip, device_name
+        ) VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+    """, (
+        request.vendor, request.model, request.os_version,
+        request.feature, request.parameters, put_blob(conn, generated_config),
+        request.device_ip, request.device_name
+    ))
+    conn.commit()
+    conn.close()
+
+def unpooled_feedback(request_id, status, prompt, generated_config, db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO feedback_log (request_id, status, prompt_hash, config_hash)
+        VALUES (?, ?, ?, ?)
+    """, (request_id, status, put_blob(conn, prompt), put_blob(conn, generated_config)))
+    conn.commit()
+    conn.close()
+
+def run(mode, threads, ops, db_path):
+    errors = []
+
+    def worker():
+        for i in range(ops):
+            try:
+                if mode == "pooled":
+                    store_in_staging_queue(REQUEST, CONFIG, db_path=db_path)
+                    log_feedback(i, "pushed", "prompt", CONFIG, db_path=db_path)
+                else:
+                    unpooled_store(REQUEST, CONFIG, db_path)
+                    unpooled_feedback(i, "pushed", "prompt", CONFIG, db_path)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+        if mode == "pooled":
+            close_connections()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return (threads * ops * 2) / elapsed, len(errors)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="staging_queue.db write throughput")
+    parser.add_argument("--ops", type=int, default=500, help="store+feedback pairs per thread")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'threads':>8}{'writes/s':>12}{'errors':>8}")
+    for mode in ("unpooled", "pooled"):
+        for threads in args.threads:
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = os.path.join(tmp, "staging_queue.db")
+                init_staging_db(db_path)
+                init_feedback_db(db_path)
+                migrate_staging_db(db_path)
+                if mode == "unpooled":
+                    # Start from the default rollback journal for the baseline
+                    close_connections()
+                    conn = sqlite3.connect(db_path)
+                    conn.execute("PRAGMA journal_mode = DELETE")
+                    conn.close()
+                rate, errors = run(mode, threads, args.ops, db_path)
+                close_connections()
+            print(f"{mode:<10}{threads:>8}{rate:>12.0f}{errors:>8}")
@@ -0,0 +1,257 @@
+#bench_pipeline.py
+#
+# End-to-end benchmark of retrieval -> prompt -> generate -> stage -> push on
+# a synthetic library, with the fake Ollama and fake SSH servers standing in
+# for the model and the switches. Everything runs in a scratch directory.
+#   python tooling/bench_pipeline.py --blocks 100000 --save-baseline bench.json
+#   python tooling/bench_pipeline.py --blocks 100000 --baseline bench.json
+# With --baseline the exit status is 1 when any p95 or throughput moved past
+# --tolerance in the wrong direction.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import uvicorn
+
+from fake_ollama import create_app
+from fake_ssh import FakeSSHServer
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stub_ollama(latency, tokens_per_sec):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(latency=latency, tokens_per_sec=tokens_per_sec),
+        host="127.0.0.1", port=port, log_level="warning"
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, port
+
+def summarize(name, latencies, elapsed):
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3) if ordered else None
+
+    return {
+        "name": name, "n": len(latencies), "seconds": round(elapsed, 3),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99)
+    }
+
+def timed_loop(name, calls):
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        began = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - began)
+    return summarize(name, latencies, time.perf_counter() - start)
+
+async def timed_requests(name, client, requests, concurrency):
+    # requests are (method, url, json); concurrency clients share the list
+    latencies = []
+    statuses = {}
+    pending = list(reversed(requests))
+
+    async def worker():
+        while pending:
+            method, url, body = pending.pop()
+            began = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - began)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = summarize(name, latencies, time.perf_counter() - start)
+    result["statuses"] = statuses
+    return result
+
+def seed_staging(keys, rows, push_rows, seed):
+    # Reviewed history for weighted retrieval and webhook generation, plus
+    # pending Catalyst rows (cisco_ios, what the fake SSH server speaks) to push
+    from models.config_request import ConfigRequest
+    from utils.database import log_feedback, store_batch_in_staging_queue
+    rng = random.Random(seed)
+
+    def request(vendor, model, os_version, feature, n):
+        return ConfigRequest(vendor=vendor, model=model, os_version=os_version, feature=feature,
+                             parameters=f"bench request {n}", device_ip="127.0.0.1", device_name=f"bench-{n}")
+
+    history = [(request(*rng.choice(keys), n), f"vlan {n % 4094 + 1}\n  name BENCH_{n}", "pending", None)
+               for n in range(rows)]
+    ids = store_batch_in_staging_queue(history)
+    for request_id in rng.sample(ids, len(ids) // 4):
+        log_feedback(request_id, rng.choice(["pushed", "rejected", "error"]), None, None)
+    targets = [(request("Cisco", "CATALYST9300", "IOS-XE-17.6", "VLAN", n), f"vlan {n % 4094 + 1}\n name PUSH_{n}", "pending", None)
+               for n in range(push_rows)]
+    return store_batch_in_staging_queue(targets)
+
+async def bench_api(args, keys, push_ids):
+    import httpx
+    import rag_api
+    from utils.device import close_sessions
+    from utils.jobs import generation_workers
+    from utils.ollama import close_client
+
+    rng = random.Random(args.seed)
+    results = []
+    transport = httpx.ASGITransport(app=rag_api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", auth=("admin", os.getenv("UI_PASSWORD", "changeme")),
+                                 timeout=300) as client:
+        generation_workers.start()
+        try:
+            webhooks = []
+            for n in range(args.webhooks):
+                vendor, model, os_version, feature = rng.choice(keys)
+                webhooks.append(("POST", "/webhook", {
+                    "device": {"vendor": vendor, "model": model, "os_version": os_version},
+                    "feature": feature, "parameters": f"webhook {n}",
+                    "device_ip": "127.0.0.1", "device_name": f"bench-webhook-{n}"
+                }))
+            start = time.perf_counter()
+            results.append(await timed_requests("/webhook", client, webhooks, args.concurrency))
+            # Until the workers have generated every queued job
+            conn = rag_api.get_db_connection()
+            while conn.execute("SELECT COUNT(*) FROM staging_queue WHERE status IN ('queued', 'generating')").fetchone()[0]:
+                await asyncio.sleep(0.05)
+            drained = time.perf_counter() - start
+            results.append({"name": "webhook jobs drained", "n": args.webhooks, "seconds": round(drained, 3),
+                            "ops_per_sec": round(args.webhooks / drained, 1)})
+        finally:
+            await generation_workers.stop()
+
+        pushes = [("POST", f"/push/{request_id}", None) for request_id in push_ids]
+        results.append(await timed_requests("/push", client, pushes, args.concurrency))
+    await close_client()
+    close_sessions()
+    return results
+
+def run(args):
+    from synth_library import generate_library, library_keys
+    from utils.database import init_feedback_db, init_staging_db, migrate_staging_db
+
+    start = time.perf_counter()
+    inserted = generate_library("cli_library.db", args.blocks, seed=args.seed)
+    keys = library_keys("cli_library.db")
+    init_staging_db()
+    init_feedback_db()
+    migrate_staging_db()
+    push_ids = seed_staging(keys, args.staging_rows, args.pushes, args.seed)
+    print(f"Library: {inserted} blocks over {len(keys)} keys, staging: {args.staging_rows} rows "
+          f"(setup {time.perf_counter() - start:.1f}s)")
+
+    from models.config_request import ConfigRequest
+    from utils.ollama import build_prompt
+    from utils.query import query_entries, query_weighted_entries
+
+    rng = random.Random(args.seed)
+    sample = [rng.choice(keys) for _ in range(args.queries)]
+    results = [
+        timed_loop("query_entries", [lambda key=key: query_entries(*key) for key in sample]),
+        timed_loop("query_weighted_entries", [lambda key=key: query_weighted_entries(*key) for key in sample]),
+    ]
+    prompts = []
+    for vendor, model, os_version, feature in sample[:args.prompts]:
+        request = ConfigRequest(vendor=vendor, model=model, os_version=os_version, feature=feature,
+                                parameters="bench", device_ip="127.0.0.1", device_name="bench")
+        prompts.append((query_entries(vendor, model, os_version, feature), request))
+    results.append(timed_loop("build_prompt", [lambda item=item: build_prompt(*item) for item in prompts]))
+    results.extend(asyncio.run(bench_api(args, keys, push_ids)))
+    return results
+
+def compare(results, baseline, tolerance):
+    # A regression is a p95 above, or a throughput below, the baseline by
+    # more than the tolerance
+    previous = {item["name"]: item for item in baseline["results"]}
+    regressions = []
+    print(f"\n{'benchmark':<26}{'ops/s':>10}{'base':>10}{'p95 ms':>10}{'base':>10}  verdict")
+    for item in results:
+        base = previous.get(item["name"])
+        if base is None:
+            continue
+        verdict = "ok"
+        if item.get("p95_ms") and base.get("p95_ms") and item["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            verdict = "SLOWER p95"
+        if item.get("ops_per_sec") and base.get("ops_per_sec") and item["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            verdict = "LOWER throughput" if verdict == "ok" else verdict + ", LOWER throughput"
+        if verdict != "ok":
+            regressions.append(item["name"])
+        print(f"{item['name']:<26}{item.get('ops_per_sec') or '-':>10}{base.get('ops_per_sec') or '-':>10}"
+              f"{item.get('p95_ms') or '-':>10}{base.get('p95_ms') or '-':>10}  {verdict}")
+    return regressions
+
+def report(results):
+    print(f"\n{'benchmark':<26}{'n':>7}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for item in results:
+        print(f"{item['name']:<26}{item['n']:>7}{item.get('ops_per_sec') or '-':>10}{item.get('p50_ms') or '-':>10}"
+              f"{item.get('p95_ms') or '-':>10}{item.get('p99_ms') or '-':>10}  {item.get('statuses', '')}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval -> prompt -> generate -> stage -> push benchmark")
+    parser.add_argument("--blocks", type=int, default=10000, help="synthetic cli_library blocks (10k-1M)")
+    parser.add_argument("--staging-rows", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--prompts", type=int, default=300)
+    parser.add_argument("--webhooks", type=int, default=200)
+    parser.add_argument("--pushes", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub Ollama latency before the first token (s)")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="stub Ollama token rate, 0 for no delay")
+    parser.add_argument("--ssh-delay", type=float, default=0.0, help="fake SSH delay per command (s)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="keep the databases and noa.log here instead of a temp dir")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="noa-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    ollama_server, ollama_port = start_stub_ollama(args.llm_latency, args.tokens_per_sec)
+    ssh_server = FakeSSHServer(port=0, delay=args.ssh_delay).start()
+    # Read at import time by utils.ollama / utils.device / utils.logs
+    os.environ.update({
+        "OLLAMA_URL": f"http://127.0.0.1:{ollama_port}",
+        "NOA_SSH_PORT": str(ssh_server.port),
+        "SSH_USERNAME": "bench", "SSH_PASSWORD": "bench",
+        "NOA_LOG_LEVEL": os.getenv("NOA_LOG_LEVEL", "WARNING"),
+        # The stub answers in each vendor's syntax, so enforce only costs the check
+        "NOA_CONFIG_VALIDATION": os.getenv("NOA_CONFIG_VALIDATION", "enforce"),
+    })
+    os.chdir(workdir)
+
+    results = run(args)
+    report(results)
+    ollama_server.should_exit = True
+    ssh_server.stop()
+
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nBaseline saved to {save_path}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,112 @@
+#bench_prompt_layout.py
+#
+# Generation latency with the previous prompt layout (examples in retrieval
+# order, which moves as feedback accumulates) against the prefix-stable one,
+# using the fake Ollama with a simulated per-token prefill cost.
+#   python tooling/bench_prompt_layout.py --requests 40 --prefill-ms-per-token 0.5
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import uvicorn
+
+from fake_ollama import create_app
+from models.config_request import ConfigRequest
+
+VENDOR_FEATURES = [("Cisco", "NEXUS93180", "vlan"), ("Aruba", "6300", "ospf"), ("Fortigate", "100F", "policy")]
+
+def legacy_prompt(entries, request):
+    # build_prompt before the layout change
+    examples = "\n\n".join(entry[5] for entry in entries)
+    return f"""You are a network assistant. Based on the following CLI examples:
+{examples}
+Generate a configuration for:
+- Vendor: {request.vendor}
+- Model: {request.model}
+- OS Version: {request.os_version}
+- Feature: {request.feature}
+- Parameters: {request.parameters}
+Respond only with the CLI configuration block using triple backticks.
+"""
+
+def synthetic_entries(vendor, model, feature, count):
+    return [
+        (i, vendor, model, "1.0", feature, "\n".join(f"{feature} {i} step {j} value {i * j}" for j in range(30)))
+        for i in range(count)
+    ]
+
+def workload(requests, examples, seed):
+    # Repeated vendor/feature traffic; retrieval order is reshuffled now and
+    # then the way feedback scores reorder weighted results
+    rng = random.Random(seed)
+    entries = {key: synthetic_entries(*key, examples) for key in VENDOR_FEATURES}
+    jobs = []
+    for n in range(requests):
+        vendor, model, feature = VENDOR_FEATURES[(n // 5) % len(VENDOR_FEATURES)]
+        rows = list(entries[(vendor, model, feature)])
+        if rng.random() < 0.5:
+            rng.shuffle(rows)
+        request = ConfigRequest(vendor=vendor, model=model, os_version="1.0", feature=feature,
+                                parameters=f"request {n} id {rng.randint(1, 4000)}",
+                                device_ip="10.0.0.1", device_name=f"bench-{n}")
+        jobs.append((rows, request))
+    return jobs
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stub(prefill_per_token, cache_slots):
+    port = free_port()
+    app = create_app(prefill_per_token=prefill_per_token, cache_slots=cache_slots)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, app, port
+
+async def run(layout, jobs, app):
+    from utils.ollama import build_prompt, close_client, _generate
+    latencies = []
+    app.state.slots.clear()
+    app.state.prefilled = 0
+    for rows, request in jobs:
+        prompt = legacy_prompt(rows, request) if layout == "legacy" else build_prompt(rows, request)
+        start = time.perf_counter()
+        await _generate(prompt)
+        latencies.append(time.perf_counter() - start)
+    await close_client()
+    return latencies, app.state.prefilled
+
+def report(name, latencies, prefilled):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{name:8} mean {statistics.mean(latencies) * 1000:7.1f} ms  p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+          f"p95 {p95 * 1000:7.1f} ms  prefilled tokens {prefilled}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prompt layout prefill benchmark")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--examples", type=int, default=6, help="examples per vendor/feature")
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.5)
+    parser.add_argument("--cache-slots", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    server, app, port = start_stub(args.prefill_ms_per_token / 1000, args.cache_slots)
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{port}"
+    jobs = workload(args.requests, args.examples, args.seed)
+    for layout in ("legacy", "stable"):
+        latencies, prefilled = asyncio.run(run(layout, jobs, app))
+        report(layout, latencies, prefilled)
+    server.should_exit = True
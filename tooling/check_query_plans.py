@@ -0,0 +1,86 @@
+#check_query_plans.py
+#
+# Builds throwaway copies of both databases with the current migrations and
+# asserts that every hot query is served by an index (EXPLAIN QUERY PLAN).
+#   python tooling/check_query_plans.py
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from parse_cli_file import FILE_BLOCKS_SQL
+from utils.database import (
+    FEEDBACK_HISTORY_SQL,
+    STAGING_ROW_SQL,
+    STATUS_COUNTS_SQL,
+    get_connection,
+    init_feedback_db,
+    init_library_db,
+    init_staging_db,
+    migrate_staging_db,
+    request_count_query,
+    request_list_query
+)
+from utils.jobs import CLAIM_JOB_SQL, EXHAUSTED_JOBS_SQL, JOB_STATUS_SQL
+from utils.migrations import explain_query_plan, uses_index
+from utils.query import EXACT_ENTRIES_SQL, WEIGHTED_ENTRIES_SQL
+
+LIST_PAGES = [
+    ("/review", {"status": "pending"}),
+    ("/review by vendor", {"status": "pending", "vendor": "cisco"}),
+    ("/all-requests", {}),
+    ("/all-requests by status", {"status": "error"}),
+    ("/all-requests by device", {"device": "core-sw1"}),
+    ("/all-requests by date", {"since": "2025-01-01", "until": "2025-01-31"}),
+]
+
+def list_queries(staging_db):
+    queries = []
+    for name, filters in LIST_PAGES:
+        for cursor in ({}, {"before": 1000}, {"after": 1000}):
+            label = f"{name} page" + (f" {next(iter(cursor))}" if cursor else "")
+            sql, params = request_list_query(filters, limit=50, **cursor)
+            queries.append((label, staging_db, sql, tuple(params)))
+        sql, params = request_count_query(filters)
+        queries.append((f"{name} count", staging_db, sql, tuple(params)))
+    return queries
+
+def hot_queries(staging_db, library_db):
+    key = ("cisco", "nexus93180", "nxos-9.3", "vlan")
+    return list_queries(staging_db) + [
+        ("query_entries exact match", library_db, EXACT_ENTRIES_SQL, key),
+        ("ingest section diff", library_db, FILE_BLOCKS_SQL, ("/data/cli_files/cisco_nexus93180_nxos-9.3.cli",)),
+        ("query_weighted_entries", staging_db, WEIGHTED_ENTRIES_SQL, (1.0,) + key + (10,)),
+        ("/all-requests status counts", staging_db, STATUS_COUNTS_SQL, ()),
+        ("/review detail and approve", staging_db, STAGING_ROW_SQL, (1,)),
+        ("/review detail feedback history", staging_db, FEEDBACK_HISTORY_SQL, (1,)),
+        ("generation worker claim", staging_db, CLAIM_JOB_SQL, (0.0, 0.0, 3)),
+        ("generation worker exhausted sweep", staging_db, EXHAUSTED_JOBS_SQL, (0.0, 3)),
+        ("webhook job status", staging_db, JOB_STATUS_SQL, (1,)),
+    ]
+
+# An unfiltered newest-first page walks the table backwards in rowid order
+# and stops at LIMIT, which EXPLAIN reports as a plain SCAN
+BOUNDED_SCANS = {"/all-requests page": ["SCAN staging_queue"]}
+
+def check(staging_db, library_db):
+    failures = 0
+    for name, db_path, sql, params in hot_queries(staging_db, library_db):
+        plan = explain_query_plan(get_connection(db_path), sql, params)
+        ok = uses_index(plan) or BOUNDED_SCANS.get(name) == plan
+        failures += not ok
+        print(f"{'OK ' if ok else 'FAIL'} {name}: {' | '.join(plan)}")
+    return failures
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        staging_db = os.path.join(tmp, "staging_queue.db")
+        library_db = os.path.join(tmp, "cli_library.db")
+        init_staging_db(staging_db)
+        init_feedback_db(staging_db)
+        migrate_staging_db(staging_db)
+        init_library_db(library_db)
+        failures = check(staging_db, library_db)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,185 @@
+#check_validation.py
+#
+# Runs the config syntax check (utils/validation.py) over known-good configs
+# for every vendor family, which must pass clean, and over known-bad ones,
+# which must report a problem. Run it after changing the grammars and before
+# setting NOA_CONFIG_VALIDATION=enforce.
+#   python tooling/check_validation.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils.validation import validate_config
+
+# (name, vendor, model, config, should pass)
+CASES = [
+    ("Catalyst9300 access switch", "cisco", "Catalyst9300", """
+hostname access-sw1
+errdisable recovery cause bpduguard
+errdisable recovery interval 300
+power inline consumption default 15400
+spanning-tree mode rapid-pvst
+vlan 10
+ name USERS
+interface GigabitEthernet1/0/1
+ description user port
+ switchport mode access
+ switchport access vlan 10
+ power inline auto
+ spanning-tree portfast
+ no shutdown
+ip access-list extended MGMT
+ 10 permit tcp 10.0.0.0 0.0.0.255 any eq 22
+ 20 deny ip any any log
+ remark management only
+access-list 10 permit 10.0.0.0 0.0.0.255
+line con 0
+ logging synchronous
+line vty 0 4
+ access-class 10 in
+ exec-timeout 10 0
+ login local
+ transport input ssh
+end
+write memory
+""", True),
+    ("Catalyst9300 route-map and QoS", "cisco", "Catalyst9300", """
+route-map LOCAL-PREF permit 10
+ match ip address prefix-list PREFERRED
+ set local-preference 200
+class-map match-any VOICE
+ match dscp ef
+policy-map EDGE
+ class VOICE
+  priority level 1
+  police cir 1000000
+interface GigabitEthernet1/0/2
+ service-policy input EDGE
+""", True),
+    ("Nexus93180 ACL and vty", "cisco", "Nexus93180", """
+feature interface-vlan
+vlan 100
+  name SERVERS
+ip access-list MGMT-IN
+  10 permit tcp 10.0.0.0/24 any eq 22
+  20 deny ip any any
+  statistics per-entry
+interface Vlan100
+  ip address 192.168.100.1/24
+  ip access-group MGMT-IN in
+  no shutdown
+interface Ethernet1/1
+  switchport
+  switchport mode trunk
+  switchport trunk allowed vlan 100,200
+  no shutdown
+line vty
+  exec-timeout 15
+  access-class MGMT-IN in
+copy running-config startup-config
+""", True),
+    ("Aruba 2930F VLAN and ACL", "aruba", "2930F", """
+hostname "edge-1"
+vlan 10
+   name "USERS"
+   untagged 1-12
+   tagged 49
+   exit
+ip access-list extended "MGMT"
+   10 permit tcp 10.0.0.0 0.0.0.255 0.0.0.0 255.255.255.255 eq 22
+   20 deny ip 0.0.0.0 255.255.255.255 0.0.0.0 255.255.255.255
+   exit
+interface 1
+   power-over-ethernet
+   exit
+write memory
+""", True),
+    ("Aruba 6300 VLAN and ACL", "aruba", "6300", """
+hostname core-1
+vlan 10
+    name USERS
+access-list ip MGMT
+    10 permit tcp 10.0.0.0/24 any eq 22
+    20 deny any any any
+interface 1/1/1
+    no shutdown
+    vlan access 10
+""", True),
+    ("Fortigate 300E interface and address", "fortigate", "300E", """
+config system interface
+    edit "port1"
+        set ip 192.168.1.99 255.255.255.0
+        set allowaccess ping https ssh
+    next
+end
+config firewall address
+    edit "LAN"
+        set subnet 10.0.0.0 255.255.255.0
+    next
+end
+""", True),
+    ("HPE FF5700 VLAN, ACL and vty", "hpe", "FF5700", """
+system-view
+sysname core-5700
+vlan 10
+ name USERS
+ quit
+acl advanced 3000
+ rule 5 permit tcp source 10.0.0.0 0.0.0.255 destination-port eq 22
+ rule 10 deny ip
+ quit
+interface Ten-GigabitEthernet1/0/1
+ port link-type access
+ port access vlan 10
+ packet-filter 3000 inbound
+ quit
+user-interface vty 0 4
+ authentication-mode scheme
+ protocol inbound ssh
+ quit
+return
+save force
+""", True),
+    ("Catalyst9300 ACL entry outside an ACL", "cisco", "Catalyst9300", """
+interface GigabitEthernet1/0/1
+ 10 permit ip any any
+""", False),
+    ("Catalyst9300 line command at global level", "cisco", "Catalyst9300", """
+access-class 10 in
+""", False),
+    ("Nexus93180 config after end", "cisco", "Nexus93180", """
+vlan 100
+  name SERVERS
+end
+interface Ethernet1/1
+""", False),
+    ("Aruba 2930F VLAN id out of range", "aruba", "2930F", """
+vlan 5000
+   name "BAD"
+""", False),
+    ("HPE FF5700 ACL rule outside an ACL", "hpe", "FF5700", """
+system-view
+rule 5 permit ip
+""", False),
+    ("Fortigate 300E edit without next", "fortigate", "300E", """
+config system interface
+    edit "port1"
+        set ip 192.168.1.99 255.255.255.0
+end
+""", False),
+]
+
+def check():
+    failures = 0
+    for name, vendor, model, config, should_pass in CASES:
+        problems = validate_config(config, vendor, model)
+        ok = not problems if should_pass else bool(problems)
+        failures += not ok
+        detail = "; ".join(problems) if problems else "no problems"
+        print(f"{'OK ' if ok else 'FAIL'} {name}: {detail}")
+    return failures
+
+if __name__ == "__main__":
+    sys.exit(1 if check() else 0)
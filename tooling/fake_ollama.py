@@ -0,0 +1,96 @@
+#fake_ollama.py
+#
+# Minimal stand-in for Ollama's /api/generate so the async client can be
+# exercised without a GPU:  python tooling/fake_ollama.py --latency 0.5
+# then run the API with OLLAMA_URL=http://127.0.0.1:11435
+
+import argparse
+import asyncio
+import json
+import re
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+CANNED_RESPONSE = "```\nvlan 30\n  name IoT\n```"
+# Answers in the syntax of the vendor named in the prompt's request block, so
+# they pass the config validation stage; anything else gets CANNED_RESPONSE
+VENDOR_RESPONSES = {
+    "fortigate": '```\nconfig system interface\n    edit "VLAN30"\n        set vlanid 30\n        set interface "internal"\n    next\nend\n```',
+    "aruba": '```\nvlan 30\n   name "IoT"\n   exit\n```',
+    "hpe": "```\nvlan 30\n name IoT\n quit\n```",
+}
+_VENDOR_RE = re.compile(r"^- Vendor: (.*)$", re.MULTILINE)
+
+def response_for(prompt):
+    match = _VENDOR_RE.search(prompt)
+    vendor = match.group(1).lower() if match else ""
+    return next((text for key, text in VENDOR_RESPONSES.items() if key in vendor), CANNED_RESPONSE)
+
+def common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+def create_app(latency=0.0, tokens_per_sec=0.0, response_text=None, prefill_per_token=0.0, cache_slots=1):
+    # prefill_per_token simulates prompt evaluation: like the real runner, the
+    # stub remembers the last prompt of each of its cache slots and only pays
+    # for the tokens after the longest shared prefix. keep_alive=0 unloads it.
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.slots = []
+    app.state.prefilled = 0
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        tokens = body.get("prompt", "").split()
+        slots = app.state.slots
+        best = max(range(len(slots)), key=lambda i: common_prefix(slots[i], tokens), default=None)
+        reused = common_prefix(slots[best], tokens) if best is not None else 0
+        if best is not None and (reused or len(slots) >= cache_slots):
+            slots.pop(best)
+        elif len(slots) >= cache_slots:
+            slots.pop(0)
+        if str(body.get("keep_alive", "")) not in ("0", "0s"):
+            slots.append(tokens)
+        else:
+            slots.clear()
+        prefill = len(tokens) - reused
+        text = response_text or response_for(body.get("prompt", ""))
+        app.state.prefilled += prefill
+
+        async def stream():
+            await asyncio.sleep(latency + prefill * prefill_per_token)
+            for token in text.split(" "):
+                if tokens_per_sec:
+                    await asyncio.sleep(1 / tokens_per_sec)
+                yield json.dumps({"model": body.get("model"), "response": token + " ", "done": False}) + "\n"
+            yield json.dumps({
+                "model": body.get("model"), "response": "", "done": True,
+                "prompt_eval_count": prefill,
+                "prompt_eval_duration": int(prefill * prefill_per_token * 1e9)
+            }) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="0 streams as fast as possible")
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.0, help="simulated prompt evaluation cost")
+    parser.add_argument("--cache-slots", type=int, default=1, help="prompt prefixes kept for reuse")
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.tokens_per_sec, prefill_per_token=args.prefill_ms_per_token / 1000,
+                     cache_slots=args.cache_slots)
+    uvicorn.run(app, host=args.host, port=args.port)
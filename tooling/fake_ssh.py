@@ -0,0 +1,137 @@
+#fake_ssh.py
+#
+# Tiny SSH server that behaves enough like a Cisco IOS prompt for netmiko's
+# send_config_set, so pushes can be exercised without real switches:
+#   python tooling/fake_ssh.py --port 2222 --delay 0.05
+# then run the API with NOA_SSH_PORT=2222 and device_ip 127.0.0.1.
+# Any username/password is accepted, keep it on loopback.
+
+import argparse
+import socket
+import threading
+import time
+
+import paramiko
+
+class _DeviceInterface(paramiko.ServerInterface):
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        return True
+
+class FakeSSHServer:
+    def __init__(self, host="127.0.0.1", port=2222, delay=0.0, hostname="fake-sw"):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.hostname = hostname
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.connections = 0
+        self.commands = []
+        self._lock = threading.Lock()
+        self._sock = None
+        self._running = False
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self.port = self._sock.getsockname()[1]
+        self._sock.listen(128)
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._sock:
+            self._sock.close()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def _handle(self, client):
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=_DeviceInterface())
+            channel = transport.accept(20)
+            if channel is None:
+                return
+            with self._lock:
+                self.connections += 1
+            self._shell(channel)
+        except (EOFError, OSError, paramiko.SSHException):
+            pass
+        finally:
+            transport.close()
+
+    def _prompt(self, mode):
+        return f"{self.hostname}(config)#" if mode == "config" else f"{self.hostname}#"
+
+    def _shell(self, channel):
+        mode = "exec"
+        buffer = ""
+        previous = ""
+        channel.send(self._prompt(mode))
+        while True:
+            data = channel.recv(4096)
+            if not data:
+                break
+            for char in data.decode("utf-8", "ignore"):
+                if char in "\r\n":
+                    if char == "\n" and previous == "\r":
+                        previous = char
+                        continue
+                    previous = char
+                    line = buffer.strip()
+                    buffer = ""
+                    if line in ("configure terminal", "conf t"):
+                        mode = "config"
+                    elif line == "end" or (line == "exit" and mode == "config"):
+                        mode = "exec"
+                    elif line == "exit":
+                        channel.close()
+                        return
+                    elif line and mode == "config":
+                        with self._lock:
+                            self.commands.append(line)
+                    if self.delay:
+                        time.sleep(self.delay)
+                    channel.send("\r\n" + self._prompt(mode))
+                else:
+                    previous = char
+                    buffer += char
+                    channel.send(char)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake SSH network device")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2222)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per command")
+    args = parser.parse_args()
+
+    server = FakeSSHServer(args.host, args.port, args.delay).start()
+    print(f"Fake SSH device listening on {args.host}:{server.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
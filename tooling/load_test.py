@@ -0,0 +1,241 @@
+#load_test.py
+#
+# Concurrent reviewers and webhook storms against the API. Each simulated
+# client loops over a weighted mix of actions (webhook bursts, /review
+# polling, opening a request, approve/reject/push clicks, /all-requests
+# browsing) with a random think time, for --duration seconds at each
+# concurrency level. In-process by default: the app runs on the ASGI
+# transport against a seeded scratch database, with the generation workers,
+# the fake Ollama and the fake SSH server. --url drives a running server
+# instead (its own database and backends).
+#   python tooling/load_test.py --clients 1 10 100 1000 --duration 20
+#   python tooling/load_test.py --url http://127.0.0.1:8000 --clients 10 100
+# Levels share one database, which keeps growing from level to level.
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx
+
+from bench_pipeline import start_stub_ollama
+from fake_ssh import FakeSSHServer
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ACTION_WEIGHTS = {
+    "webhook_burst": 10,
+    "review_poll": 30,
+    "open_request": 15,
+    "approve": 6,
+    "reject": 6,
+    "push": 3,
+    "browse_all": 20,
+}
+_ID_RE = re.compile(r'href="/review/(\d+)"')
+
+def percentile(ordered, p):
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 1) if ordered else None
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.lock_errors = 0
+        self.requests = 0
+
+    def record(self, action, latency, error=None):
+        self.requests += 1
+        self.latencies.setdefault(action, []).append(latency)
+        if error:
+            self.errors[action] = self.errors.get(action, 0) + 1
+            if "locked" in error or "busy" in error:
+                self.lock_errors += 1
+
+    def error_count(self):
+        return sum(self.errors.values())
+
+class LoadClient:
+    # One simulated user; the ids reviewers see on /review are shared so
+    # clicks go to requests that were actually listed
+    def __init__(self, client, stats, rng, seen_ids, burst_size):
+        self.client = client
+        self.stats = stats
+        self.rng = rng
+        self.seen_ids = seen_ids
+        self.burst_size = burst_size
+
+    async def request(self, action, method, url, **kwargs):
+        began = time.perf_counter()
+        error = None
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            if response.status_code >= 500:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except Exception as e:
+            # The ASGI transport re-raises app exceptions, sqlite3's
+            # "database is locked" among them
+            response = None
+            error = f"{type(e).__name__}: {e}"
+        self.stats.record(action, time.perf_counter() - began, error)
+        return response
+
+    def webhook_payload(self):
+        return {
+            "device": {"vendor": "Cisco", "model": "CATALYST9300", "os_version": "IOS-XE-17.6"},
+            "feature": "VLAN", "parameters": f"vlan {self.rng.randint(2, 4094)}",
+            "device_ip": "127.0.0.1", "device_name": f"load-{self.rng.randint(1, 500)}"
+        }
+
+    async def webhook_burst(self):
+        await asyncio.gather(*(
+            self.request("webhook", "POST", "/webhook", json=self.webhook_payload())
+            for _ in range(self.burst_size)
+        ))
+
+    async def review_poll(self):
+        response = await self.request("review_poll", "GET", "/review")
+        if response is not None and response.status_code == 200:
+            self.seen_ids.extend(int(found) for found in _ID_RE.findall(response.text)[:20])
+            del self.seen_ids[:-500]
+
+    def pick_id(self):
+        return self.seen_ids.pop(self.rng.randrange(len(self.seen_ids))) if self.seen_ids else None
+
+    async def open_request(self):
+        if self.seen_ids:
+            await self.request("open_request", "GET", f"/review/{self.rng.choice(self.seen_ids)}")
+
+    async def click(self, action):
+        request_id = self.pick_id()
+        if request_id is not None:
+            await self.request(action, "POST", f"/{action}/{request_id}")
+
+    async def browse_all(self):
+        params = {}
+        if self.rng.random() < 0.5:
+            params["status"] = self.rng.choice(["pending", "pushed", "rejected", "error"])
+        if self.rng.random() < 0.3:
+            params["vendor"] = "cisco"
+        if self.rng.random() < 0.3 and self.seen_ids:
+            params["before"] = self.rng.choice(self.seen_ids)
+        await self.request("browse_all", "GET", "/all-requests", params=params)
+
+    async def run(self, deadline, think):
+        actions, weights = zip(*ACTION_WEIGHTS.items())
+        while time.monotonic() < deadline:
+            action = self.rng.choices(actions, weights)[0]
+            if action in ("approve", "reject", "push"):
+                await self.click(action)
+            else:
+                await getattr(self, action)()
+            if think:
+                await asyncio.sleep(self.rng.expovariate(1 / think))
+
+async def run_level(client, clients, duration, think, burst_size, seen_ids, seed):
+    stats = LoadStats()
+    deadline = time.monotonic() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        LoadClient(client, stats, random.Random(seed + n), seen_ids, burst_size).run(deadline, think)
+        for n in range(clients)
+    ))
+    return stats, time.perf_counter() - start
+
+def report(clients, stats, elapsed):
+    error_rate = stats.error_count() / stats.requests if stats.requests else 0.0
+    print(f"\n{clients} clients: {stats.requests} requests in {elapsed:.1f}s = {stats.requests / elapsed:.1f} req/s, "
+          f"errors {stats.error_count()} ({error_rate:.2%}), SQLite lock errors {stats.lock_errors}")
+    print(f"  {'action':<14}{'n':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for action in sorted(stats.latencies):
+        ordered = sorted(stats.latencies[action])
+        print(f"  {action:<14}{len(ordered):>7}{stats.errors.get(action, 0):>8}"
+              f"{percentile(ordered, 0.5):>10}{percentile(ordered, 0.95):>10}{percentile(ordered, 0.99):>10}")
+
+async def main(args):
+    seen_ids = []
+    auth = (args.user, args.password)
+    limits = httpx.Limits(max_connections=max(args.clients) * 2, max_keepalive_connections=max(args.clients))
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, auth=auth, timeout=args.timeout, limits=limits)
+        workers = None
+    else:
+        import rag_api
+        from utils.jobs import generation_workers
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=rag_api.app), base_url="http://load",
+                                   auth=auth, timeout=args.timeout)
+        workers = generation_workers
+        workers.start()
+    try:
+        async with client:
+            for clients in args.clients:
+                stats, elapsed = await run_level(client, clients, args.duration, args.think, args.burst_size, seen_ids, args.seed)
+                report(clients, stats, elapsed)
+    finally:
+        if workers is not None:
+            await workers.stop()
+            from utils.device import close_sessions
+            from utils.ollama import close_client
+            await close_client()
+            close_sessions()
+
+def prepare_in_process(args):
+    # Scratch directory with the templates, a seeded staging queue and the
+    # stand-ins for Ollama and the switches; returns what has to be stopped
+    workdir = args.workdir or tempfile.mkdtemp(prefix="noa-load-")
+    os.makedirs(workdir, exist_ok=True)
+    templates = os.path.join(workdir, "templates")
+    if not os.path.exists(templates):
+        os.symlink(os.path.abspath(os.path.join(REPO_DIR, "templates")), templates)
+    ollama_server, ollama_port = start_stub_ollama(args.llm_latency, 0.0)
+    ssh_server = FakeSSHServer(port=0, delay=args.ssh_delay).start()
+    os.environ.update({
+        "OLLAMA_URL": f"http://127.0.0.1:{ollama_port}",
+        "NOA_SSH_PORT": str(ssh_server.port),
+        "SSH_USERNAME": "load", "SSH_PASSWORD": "load",
+        "NOA_LOG_LEVEL": os.getenv("NOA_LOG_LEVEL", "WARNING"),
+        # The stub answers in each vendor's syntax, so enforce only costs the check
+        "NOA_CONFIG_VALIDATION": os.getenv("NOA_CONFIG_VALIDATION", "enforce"),
+    })
+    os.chdir(workdir)
+
+    from bench_pipeline import seed_staging
+    from utils.database import init_feedback_db, init_staging_db, migrate_staging_db
+    init_staging_db()
+    init_feedback_db()
+    migrate_staging_db()
+    seed_staging([("Cisco", "CATALYST9300", "IOS-XE-17.6", "VLAN")], args.seed_rows, args.seed_rows, args.seed)
+    print(f"Scratch database in {workdir}, fake Ollama on :{ollama_port}, fake SSH on :{ssh_server.port}")
+    return ollama_server, ssh_server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent reviewer and webhook load test")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument("--think", type=float, default=0.5, help="mean pause between a client's actions (s)")
+    parser.add_argument("--burst-size", type=int, default=10, help="webhooks per burst")
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default=os.getenv("UI_PASSWORD", "changeme"))
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed-rows", type=int, default=2000, help="pending rows seeded in-process")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--ssh-delay", type=float, default=0.0)
+    parser.add_argument("--workdir")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    servers = None if args.url else prepare_in_process(args)
+    try:
+        asyncio.run(main(args))
+    finally:
+        if servers:
+            ollama_server, ssh_server = servers
+            ollama_server.should_exit = True
+            ssh_server.stop()
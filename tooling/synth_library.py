@@ -0,0 +1,83 @@
+#synth_library.py
+#
+# Synthetic cli_library for benchmarks. The real blocks under cli_files/ are
+# the templates: each is spread over made-up model variants of its vendor and
+# its numbers (VLAN ids, addresses, interface indexes) are re-drawn, so every
+# block is distinct while the vendor/feature mix matches the real library.
+#   python tooling/synth_library.py --blocks 100000 --db /tmp/bench/cli_library.db
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from parse_cli_file import INSERT_SQL
+from utils.cli_blocks import CLI_EXTENSIONS, iter_blocks, make_row
+from utils.database import get_connection, init_library_db
+
+CLI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cli_files")
+_NUMBER_RE = re.compile(r"\d+")
+
+def load_templates(cli_dir=CLI_DIR):
+    # (vendor, model, os_version, feature, cli_block); blocks without any
+    # number to vary could only ever produce one row, they are left out
+    templates = []
+    for name in sorted(os.listdir(cli_dir)):
+        if name.endswith(CLI_EXTENSIONS):
+            for row in iter_blocks(os.path.join(cli_dir, name)):
+                if _NUMBER_RE.search(row[4]):
+                    templates.append(row[:5])
+    return templates
+
+def model_variant(model, variant):
+    return model if variant == 0 else f"{model}-V{variant}"
+
+def mutate(rng, block):
+    return _NUMBER_RE.sub(lambda _: str(rng.randint(1, 254)), block)
+
+def iter_synthetic_rows(templates, blocks, variants=5, seed=7):
+    rng = random.Random(seed)
+    for n in range(blocks):
+        vendor, model, os_version, feature, block = templates[n % len(templates)]
+        variant = (n // len(templates)) % variants
+        yield make_row(vendor, model_variant(model, variant), os_version, feature, mutate(rng, block), "synthetic")
+
+def generate_library(db_path, blocks, variants=5, seed=7, cli_dir=CLI_DIR, batch_size=10000):
+    # Returns the number of rows inserted; re-drawn numbers occasionally
+    # repeat a block, those are dropped by the content hash
+    init_library_db(db_path)
+    conn = get_connection(db_path)
+    templates = load_templates(cli_dir)
+    rows = iter_synthetic_rows(templates, blocks, variants, seed)
+    inserted = 0
+    while True:
+        batch = [row for _, row in zip(range(batch_size), rows)]
+        if not batch:
+            break
+        with conn:
+            inserted += conn.executemany(INSERT_SQL, batch).rowcount
+    return inserted
+
+def library_keys(db_path):
+    conn = get_connection(db_path)
+    return [tuple(row) for row in conn.execute(
+        "SELECT DISTINCT vendor, model, os_version, feature FROM cli_library ORDER BY 1, 2, 3, 4"
+    ).fetchall()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic cli_library")
+    parser.add_argument("--db", default="cli_library.db")
+    parser.add_argument("--blocks", type=int, default=10000)
+    parser.add_argument("--variants", type=int, default=5, help="model variants per vendor")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    inserted = generate_library(args.db, args.blocks, args.variants, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"Inserted {inserted}/{args.blocks} blocks over {len(library_keys(args.db))} "
+          f"vendor/model/os/feature keys in {elapsed:.1f}s ({inserted / elapsed:.0f} blocks/s)")
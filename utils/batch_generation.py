@@ -0,0 +1,116 @@
+#batch_generation.py
+
+import asyncio
+import logging
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from utils.cache import generation_cache
+from utils.database import store_batch_in_staging_queue
+from utils.ollama import build_prompt, call_ollama, generation_failed, select_examples
+from utils.query import normalize, query_weighted_entries
+
+logger = logging.getLogger("rag_api")
+
+BATCH_CONCURRENCY = int(os.getenv("NOA_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("NOA_BATCH_MAX_ITEMS", "1000"))
+
+def group_key(request):
+    # Retrieval keys on os_version as well, so it is part of the group
+    return (normalize(request.vendor), normalize(request.model), normalize(request.os_version), normalize(request.feature))
+
+def _prepare(request, entries):
+    # Cache key, lookup and prompt in one threadpool hop; token counting and
+    # packing are only paid on a miss
+    key = generation_cache.key_for(request, select_examples(entries))
+    cached = generation_cache.get(key)
+    return key, cached, build_prompt(entries, request) if cached is None else None
+
+async def _generate_item(index, request, entries, slots):
+    if not entries:
+        return index, None, "No CLI examples found."
+    # Prepared once a slot is free, so repeats further down the batch find
+    # what earlier items generated, and at most one slot's worth of items
+    # competes with the event loop for the threadpool
+    async with slots:
+        key, cached, prompt = await run_in_threadpool(_prepare, request, entries)
+        if cached is not None:
+            return index, cached, None
+        generated_config = await call_ollama(prompt, vendor=request.vendor, feature=request.feature, model=request.model)
+    if generation_failed(generated_config):
+        return index, None, generated_config
+    await run_in_threadpool(generation_cache.set, key, generated_config)
+    return index, generated_config, None
+
+async def generate_batch(requests, concurrency=None, db_path="staging_queue.db"):
+    # Async generator of one dict per finished item, in completion order,
+    # then a summary. Retrieval runs once per group; LLM calls are capped by
+    # the semaphore and identical prompts coalesce in call_ollama. Rows are
+    # written to staging_queue in one transaction once every item is done,
+    # the summary carries their ids. If the client goes away mid-batch the
+    # outstanding calls are cancelled and the finished items still stored.
+    start = time.perf_counter()
+    groups = {}
+    for index, request in enumerate(requests):
+        groups.setdefault(group_key(request), []).append(index)
+
+    entries_by_group = {}
+    for key, indexes in groups.items():
+        first = requests[indexes[0]]
+        entries_by_group[key] = await run_in_threadpool(
+            query_weighted_entries,
+            vendor=first.vendor,
+            model=first.model,
+            os_version=first.os_version,
+            feature=first.feature
+        )
+    logger.info(f"Batch of {len(requests)} requests in {len(groups)} retrieval groups")
+
+    slots = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+    tasks = [
+        asyncio.ensure_future(_generate_item(index, requests[index], entries_by_group[key], slots))
+        for key, indexes in groups.items()
+        for index in indexes
+    ]
+    finished = {}
+    stored = False
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, generated_config, error = await next_done
+            finished[index] = (generated_config, error)
+            yield {
+                "index": index,
+                "device_name": requests[index].device_name,
+                "status": "generated" if error is None else "failed",
+                "generated_config": generated_config,
+                "error": error
+            }
+        ids = await run_in_threadpool(_store, requests, finished, db_path)
+        stored = True
+        failed = sum(1 for _, error in finished.values() if error is not None)
+        yield {
+            "summary": True,
+            "total": len(requests),
+            "generated": len(requests) - failed,
+            "failed": failed,
+            "groups": len(groups),
+            "seconds": round(time.perf_counter() - start, 3),
+            "staging_ids": ids
+        }
+    finally:
+        for task in tasks:
+            task.cancel()
+        if not stored and finished:
+            await run_in_threadpool(_store, requests, finished, db_path)
+            logger.info(f"Batch interrupted, stored {len(finished)}/{len(requests)} finished items")
+
+def _store(requests, finished, db_path):
+    order = sorted(finished)
+    results = [
+        (requests[index], finished[index][0], "pending" if finished[index][1] is None else "failed", finished[index][1])
+        for index in order
+    ]
+    ids = store_batch_in_staging_queue(results, db_path)
+    return dict(zip(order, ids))
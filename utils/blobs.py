@@ -0,0 +1,88 @@
+#blobs.py
+
+import hashlib
+import logging
+import os
+import zlib
+
+logger = logging.getLogger("rag_api")
+
+# Generated configs and legacy prompt text live once per distinct content in
+# the blobs table, keyed by sha256 and compressed. staging_queue.config_hash,
+# feedback_log.config_hash and feedback_log.prompt_hash reference it; triggers
+# (utils/migrations.py, step 6) keep refcount in step with those columns and
+# drop a blob when its last reference goes. Readers join blobs and decode
+# with the unpack_blob(codec, data) SQL function registered on every pooled
+# connection, see STAGING_ROW_SQL in utils/database.py.
+#
+# zstd needs the optional zstandard package; zlib is always there. The codec
+# is stored per blob, so switching NOA_BLOB_CODEC only affects new blobs.
+BLOB_CODEC = os.getenv("NOA_BLOB_CODEC", "zstd")
+ZLIB_LEVEL = int(os.getenv("NOA_BLOB_ZLIB_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("NOA_BLOB_ZSTD_LEVEL", "9"))
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def _codec():
+    if BLOB_CODEC == "zstd" and zstandard is None:
+        return "zlib"
+    return BLOB_CODEC
+
+def compress(data):
+    codec = _codec()
+    if codec == "zstd":
+        packed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    elif codec == "zlib":
+        packed = zlib.compress(data, ZLIB_LEVEL)
+    else:
+        return "raw", data
+    # Short configs often come out larger, keep those as they are
+    if len(packed) >= len(data):
+        return "raw", data
+    return codec, packed
+
+def decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return data
+
+def unpack_blob(codec, data):
+    if data is None:
+        return None
+    return decompress(codec, data).decode("utf-8")
+
+def register_blob_functions(conn):
+    conn.create_function("unpack_blob", 2, unpack_blob, deterministic=True)
+
+def put_blob(conn, text):
+    # Returns the hash to store in the referencing column, None for None.
+    # The reference count is taken by the trigger on that column, so the
+    # insert referencing the blob has to follow in the same transaction.
+    if text is None:
+        return None
+    data = text.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    if conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is None:
+        codec, packed = compress(data)
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+            (digest, codec, len(data), packed)
+        )
+    return digest
+
+def get_blob(conn, digest):
+    if digest is None:
+        return None
+    row = conn.execute("SELECT codec, data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+    return unpack_blob(row[0], row[1]) if row else None
+
+def drop_unreferenced(conn, digest):
+    # For a blob put without the referencing write going through
+    conn.execute("DELETE FROM blobs WHERE hash = ? AND refcount <= 0", (digest,))
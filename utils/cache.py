@@ -0,0 +1,161 @@
+#cache.py
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils.database import get_connection, get_library_version
+from utils.metrics import GENERATION_CACHE
+from utils.query import normalize
+
+logger = logging.getLogger("rag_api")
+
+def examples_hash(examples):
+    digest = hashlib.sha256()
+    for example in examples:
+        digest.update((example or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def cache_key(request, examples, library_version=0):
+    payload = {
+        "vendor": normalize(request.vendor),
+        "model": normalize(request.model),
+        "os_version": normalize(request.os_version),
+        "feature": normalize(request.feature),
+        # Parameters keep their case, device names in them end up in the config
+        "parameters": " ".join(request.parameters.split()),
+        "examples": examples_hash(examples),
+        "library_version": library_version
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class GenerationCache:
+    def __init__(self, max_entries=1024, ttl=3600, db_path=None, max_persistent_entries=100000,
+                 library_db_path="cli_library.db"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_persistent_entries = max_persistent_entries
+        self.library_db_path = library_db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            self._init_persistent()
+
+    def _init_persistent(self):
+        conn = get_connection(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                expires_at REAL,
+                last_access REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_generation_cache_last_access ON generation_cache (last_access)")
+        conn.commit()
+
+    def key_for(self, request, examples):
+        version = get_library_version(request.vendor, request.feature, self.library_db_path)
+        return cache_key(request, examples, version)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    GENERATION_CACHE.inc(result="hit")
+                    return value
+                del self._entries[key]
+
+        value = self._get_persistent(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                GENERATION_CACHE.inc(result="miss")
+                return None
+            self.persistent_hits += 1
+            GENERATION_CACHE.inc(result="persistent_hit")
+        self._put_memory(key, value, now + self.ttl)
+        return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._put_memory(key, value, expires_at)
+        self._set_persistent(key, value, expires_at)
+
+    def _put_memory(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_persistent(self, key, now):
+        if not self.db_path:
+            return None
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT value FROM generation_cache WHERE key = ? AND expires_at > ?", (key, now))
+        row = cursor.fetchone()
+        if row:
+            with conn:
+                cursor.execute("UPDATE generation_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[0] if row else None
+
+    def _set_persistent(self, key, value, expires_at):
+        if not self.db_path:
+            return
+        now = time.time()
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO generation_cache (key, value, expires_at, last_access)
+                VALUES (?, ?, ?, ?)
+            """, (key, value, expires_at, now))
+            conn.execute("DELETE FROM generation_cache WHERE expires_at <= ?", (now,))
+            conn.execute("""
+                DELETE FROM generation_cache WHERE key IN (
+                    SELECT key FROM generation_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_persistent_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            conn = get_connection(self.db_path)
+            with conn:
+                conn.execute("DELETE FROM generation_cache")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.persistent_hits) / lookups if lookups else 0.0
+            }
+
+generation_cache = GenerationCache(
+    max_entries=int(os.getenv("NOA_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("NOA_CACHE_TTL", "3600")),
+    db_path=os.getenv("NOA_CACHE_DB") or None
+)
@@ -0,0 +1,44 @@
+#cli_blocks.py
+
+import os
+
+from utils.database import content_hash
+
+# Reading of the ### delimited CLI example files, shared by the ingest
+# script (parse_cli_file.py) and the config grammars (utils/validation.py)
+CLI_EXTENSIONS = (".cli", ".txt")
+
+def make_row(vendor, model, os_version, feature, cli_block, source):
+    cli_block = cli_block.strip()
+    return (vendor, model, os_version, feature, cli_block, source,
+            content_hash(vendor, model, os_version, feature, cli_block))
+
+def file_metadata(file_path):
+    source = os.path.basename(file_path)
+    filename = source.replace(".cli", "").replace(".txt", "")
+    parts = filename.split("_")
+
+    vendor = parts[0].capitalize() if len(parts) > 0 else "Unknown"
+    model = parts[1].upper() if len(parts) > 1 else "Unknown"
+    os_version = parts[2].upper() if len(parts) > 2 else "Unknown"
+    return vendor, model, os_version, source
+
+def iter_blocks(file_path):
+    # Streams the file line by line and yields one ready-to-insert row per ### section
+    vendor, model, os_version, source = file_metadata(file_path)
+
+    current_feature = None
+    current_block = []
+
+    with open(file_path, "r") as f:
+        for line in f:
+            if line.startswith("###"):
+                if current_feature and current_block:
+                    yield make_row(vendor, model, os_version, current_feature, "\n".join(current_block), source)
+                current_block = []
+                current_feature = line.strip().replace("###", "").strip()
+            else:
+                current_block.append(line.rstrip())
+
+    if current_feature and current_block:
+        yield make_row(vendor, model, os_version, current_feature, "\n".join(current_block), source)
@@ -1,6 +1,141 @@
 #database.py
 
+import hashlib
+import json
+import math
+import os
 import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+from utils.blobs import put_blob, register_blob_functions
+from utils.metrics import DB_WRITE_SECONDS
+from utils.migrations import LIBRARY_MIGRATIONS, STAGING_MIGRATIONS, apply_migrations
+
+# Applied to every pooled connection. WAL lets reviewers read while a writer
+# commits; NORMAL sync is durable across app crashes in WAL mode.
+DB_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{int(os.getenv('NOA_DB_CACHE_KB', '20000'))}",
+    f"PRAGMA mmap_size = {int(os.getenv('NOA_DB_MMAP_BYTES', str(256 * 1024 * 1024)))}",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {int(os.getenv('NOA_DB_BUSY_TIMEOUT_MS', '5000'))}",
+)
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+# List pages never load the config/parameter blobs, and page by id (keyset)
+# rather than OFFSET so every page costs the same however deep it is.
+# tooling/check_query_plans.py checks the SQL built here.
+REQUEST_LIST_COLUMNS = "id, vendor, model, os_version, feature, device_name, device_ip, status, created_at"
+PAGE_SIZE = int(os.getenv("NOA_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 500
+
+def request_filters(status=None, vendor=None, device=None, since=None, until=None):
+    clauses = []
+    params = []
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if vendor:
+        clauses.append("vendor_n = ?")
+        params.append(vendor.strip().lower())
+    if device:
+        clauses.append("(device_name = ? OR device_ip = ?)")
+        params.extend([device.strip(), device.strip()])
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until:
+        # until is a date, the whole day is included
+        clauses.append("created_at < date(?, '+1 day')")
+        params.append(until)
+    return clauses, params
+
+def request_list_query(filters=None, before=None, after=None, limit=PAGE_SIZE):
+    clauses, params = request_filters(**(filters or {}))
+    if before is not None:
+        clauses.append("id < ?")
+        params.append(before)
+    elif after is not None:
+        clauses.append("id > ?")
+        params.append(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    order = "ASC" if before is None and after is not None else "DESC"
+    # One extra row tells whether there is another page
+    sql = f"SELECT {REQUEST_LIST_COLUMNS} FROM staging_queue {where} ORDER BY id {order} LIMIT ?"
+    return sql, params + [limit + 1]
+
+def request_count_query(filters=None):
+    clauses, params = request_filters(**(filters or {}))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return f"SELECT COUNT(*) FROM staging_queue {where}", params
+
+STATUS_COUNTS_SQL = "SELECT status, COUNT(*) FROM staging_queue GROUP BY status"
+
+# Full staging rows with the config text decoded from blobs, under its old
+# column name so callers read row["generated_config"] as before
+STAGING_ROWS_SQL = """
+    SELECT sq.*, unpack_blob(b.codec, b.data) AS generated_config
+    FROM staging_queue sq
+    LEFT JOIN blobs b ON b.hash = sq.config_hash
+"""
+STAGING_ROW_SQL = STAGING_ROWS_SQL + " WHERE sq.id = ?"
+
+# Feedback events of one request, oldest first (idx_feedback_log_request)
+FEEDBACK_HISTORY_SQL = "SELECT id, status, timestamp FROM feedback_log WHERE request_id = ? ORDER BY id"
+
+def list_requests(filters=None, before=None, after=None, limit=PAGE_SIZE, db_path="staging_queue.db"):
+    # Newest first. Returns the page plus the cursors for the neighbouring
+    # pages (None when there is nothing in that direction) and the total
+    # matching the filters.
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    conn = get_connection(db_path)
+    sql, params = request_list_query(filters, before, after, limit)
+    rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is None and after is not None:
+        rows.reverse()
+        newer = rows[0]["id"] if more and rows else None
+        older = rows[-1]["id"] if rows else None
+    else:
+        newer = rows[0]["id"] if before is not None and rows else None
+        older = rows[-1]["id"] if more else None
+    count_sql, count_params = request_count_query(filters)
+    total = conn.execute(count_sql, count_params).fetchone()[0]
+    return {"items": rows, "newer": newer, "older": older, "total": total}
+
+def status_counts(db_path="staging_queue.db"):
+    conn = get_connection(db_path)
+    return {row[0]: row[1] for row in conn.execute(STATUS_COUNTS_SQL).fetchall()}
+
+def get_connection(db_path="staging_queue.db"):
+    # One long-lived connection per thread and database file. sqlite3 keeps a
+    # per-connection cache of prepared statements, so reusing the connection
+    # also reuses the compiled INSERT/SELECT statements.
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        register_blob_functions(conn)
+        conn.create_function("decayed_score", 2, decayed_score, deterministic=True)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        connections[db_path] = conn
+    return conn
+
+def close_connections():
+    connections = getattr(_local, "connections", {})
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
 
 def score_feedback(status):
     return {
@@ -10,13 +145,63 @@ def score_feedback(status):
         "error": 0
     }.get(status, 0)
 
+# Feedback decays with this half-life. Scores are stored scaled to a fixed
+# epoch (score * 2^((t - epoch) / half_life)), so decay never has to be
+# re-applied to stored rows and ordering by the stored value is the same as
+# ordering by the decayed score at any point in time. The scaled value grows
+# without bound, so it is kept as its log2.
+FEEDBACK_HALF_LIFE = float(os.getenv("NOA_FEEDBACK_HALF_LIFE_DAYS", "30")) * 86400
+FEEDBACK_EPOCH = 1735689600  # 2025-01-01 UTC
+FEEDBACK_DEDUPE_WINDOW = float(os.getenv("NOA_FEEDBACK_DEDUPE_SECONDS", "300"))
+
+def decay_exponent(now=None):
+    return ((now or time.time()) - FEEDBACK_EPOCH) / FEEDBACK_HALF_LIFE
+
+def decayed_score(log_score, exponent):
+    # SQL function: a stored log score as a plain score at the given time
+    if log_score is None:
+        return 0.0
+    return 2.0 ** (log_score - exponent)
+
+def _log2_sum(a, b):
+    # log2(2^a + 2^b) without leaving log space
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1.0 + 2.0 ** (low - high))
+
+def accumulate_feedback_score(conn, request_id, status, timestamp=None):
+    timestamp = timestamp or time.time()
+    row = conn.execute(
+        "SELECT last_status, updated_at, log_score FROM feedback_score WHERE request_id = ?", (request_id,)
+    ).fetchone()
+    # Repeated identical events (double clicks, approve followed by push)
+    # count once within the dedupe window
+    if row and row[0] == status and row[1] and timestamp - row[1] < FEEDBACK_DEDUPE_WINDOW:
+        return
+    log_score = row[2] if row else None
+    score = score_feedback(status)
+    if score > 0:
+        log_score = _log2_sum(log_score, math.log2(score) + decay_exponent(timestamp))
+    conn.execute("""
+        INSERT INTO feedback_score (request_id, log_score, events, last_status, updated_at)
+        VALUES (?, ?, 1, ?, ?)
+        ON CONFLICT (request_id) DO UPDATE SET
+            log_score = excluded.log_score,
+            events = events + 1,
+            last_status = excluded.last_status,
+            updated_at = excluded.updated_at
+    """, (request_id, log_score, status, timestamp))
+
+def content_hash(vendor, model, os_version, feature, cli_block):
+    fields = (vendor, model, os_version, feature, (cli_block or "").strip())
+    return hashlib.sha256("\0".join(field or "" for field in fields).encode("utf-8")).hexdigest()
+
 def get_db_connection():
-    conn = sqlite3.connect("staging_queue.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_connection("staging_queue.db")
 
 def init_staging_db(db_path="staging_queue.db"):
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS staging_queue (
@@ -34,10 +219,9 @@ def init_staging_db(db_path="staging_queue.db"):
         )
     """)
     conn.commit()
-    conn.close()
 
 def init_feedback_db(db_path="staging_queue.db"):
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS feedback_log (
@@ -50,30 +234,118 @@ def init_feedback_db(db_path="staging_queue.db"):
         )
     """)
     conn.commit()
-    conn.close()
 
-def store_in_staging_queue(request, generated_config, db_path="staging_queue.db"):
-    conn = sqlite3.connect(db_path)
+def init_library_db(db_path="cli_library.db"):
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     cursor.execute("""
-        INSERT INTO staging_queue (
-            vendor, model, os_version, feature, parameters,
-            generated_config, status, device_ip, device_name
-        ) VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
-    """, (
-        request.vendor, request.model, request.os_version,
-        request.feature, request.parameters, generated_config,
-        request.device_ip, request.device_name
-    ))
+        CREATE TABLE IF NOT EXISTS cli_library (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vendor TEXT,
+            model TEXT,
+            os_version TEXT,
+            feature TEXT,
+            cli_block TEXT,
+            source TEXT
+        )
+    """)
+    # Bumped by triggers on every library change, from any process, so
+    # caches keyed on it go stale as soon as the examples they used change
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cli_library_version (
+            vendor_n TEXT,
+            feature_n TEXT,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (vendor_n, feature_n)
+        )
+    """)
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS cli_library_{event.lower()}_version
+            AFTER {event} ON cli_library
+            BEGIN
+                INSERT INTO cli_library_version (vendor_n, feature_n, version)
+                VALUES (lower(trim({row}.vendor)), lower(trim({row}.feature)), 1)
+                ON CONFLICT (vendor_n, feature_n) DO UPDATE SET version = version + 1;
+            END
+        """)
     conn.commit()
-    conn.close()
+    apply_migrations(conn, LIBRARY_MIGRATIONS)
 
-def log_feedback(request_id, status, prompt, generated_config, db_path="staging_queue.db"):
-    conn = sqlite3.connect(db_path)
+def migrate_staging_db(db_path="staging_queue.db"):
+    # Runs after init_staging_db/init_feedback_db, both tables share the file
+    apply_migrations(get_connection(db_path), STAGING_MIGRATIONS)
+
+def get_library_version(vendor, feature, db_path="cli_library.db"):
+    vendor = vendor.strip().lower()
+    feature = feature.strip().lower()
+    conn = get_connection(db_path)
     cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO feedback_log (request_id, status, prompt, generated_config)
-        VALUES (?, ?, ?, ?)
-    """, (request_id, status, prompt, generated_config))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    try:
+        # Library features carry a vendor/model prefix (CISCO_NEXUS_9300_VLAN),
+        # so match on the suffix the same way query_entries does
+        cursor.execute("""
+            SELECT COUNT(*), COALESCE(SUM(version), 0) FROM cli_library_version
+            WHERE vendor_n = ? AND (feature_n = ? OR feature_n LIKE ? ESCAPE '\\')
+        """, (vendor, feature, "%\\_" + feature))
+        count, version = cursor.fetchone()
+        if not count:
+            # Unknown vendor/feature resolves fuzzily, so any change may matter
+            cursor.execute("SELECT COALESCE(SUM(version), 0) FROM cli_library_version")
+            version = cursor.fetchone()[0]
+        return version
+    except sqlite3.OperationalError:
+        return 0
+
+@DB_WRITE_SECONDS.time(op="store_in_staging_queue")
+def store_in_staging_queue(request, generated_config, db_path="staging_queue.db"):
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("""
+            INSERT INTO staging_queue (
+                vendor, model, os_version, feature, parameters,
+                config_hash, status, device_ip, device_name
+            ) VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+        """, (
+            request.vendor, request.model, request.os_version,
+            request.feature, request.parameters, put_blob(conn, generated_config),
+            request.device_ip, request.device_name
+        ))
+
+@DB_WRITE_SECONDS.time(op="store_batch_in_staging_queue")
+def store_batch_in_staging_queue(results, db_path="staging_queue.db"):
+    # results are (request, generated_config, status, error); one transaction
+    # for the whole batch, returns the new row ids in the same order
+    conn = get_connection(db_path)
+    ids = []
+    with conn:
+        for request, generated_config, status, error in results:
+            cursor = conn.execute("""
+                INSERT INTO staging_queue (
+                    vendor, model, os_version, feature, parameters,
+                    config_hash, status, device_ip, device_name, last_error
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                request.vendor, request.model, request.os_version,
+                request.feature, request.parameters, put_blob(conn, generated_config),
+                status, request.device_ip, request.device_name, error
+            ))
+            ids.append(cursor.lastrowid)
+    return ids
+
+@DB_WRITE_SECONDS.time(op="log_feedback")
+def log_feedback(request_id, status, prompt, generated_config, db_path="staging_queue.db", commit=True):
+    # prompt is a reference from utils.prompt.prompt_reference, kept as JSON;
+    # plain prompt text is still accepted and stored as a blob. With
+    # commit=False the caller owns the transaction (and its rollback).
+    conn = get_connection(db_path)
+    with conn if commit else nullcontext():
+        if isinstance(prompt, dict):
+            prompt_ref, prompt_hash = json.dumps(prompt, separators=(",", ":")), None
+        else:
+            prompt_ref, prompt_hash = None, put_blob(conn, prompt)
+        conn.execute("""
+            INSERT INTO feedback_log (request_id, status, prompt_ref, prompt_hash, config_hash)
+            VALUES (?, ?, ?, ?, ?)
+        """, (request_id, status, prompt_ref, prompt_hash, put_blob(conn, generated_config)))
+        accumulate_feedback_score(conn, request_id, status)
\ No newline at end of file
@@ -2,10 +2,20 @@
 
 import os
 import logging
-from netmiko import ConnectHandler
+import threading
+import time
+from netmiko import ConnectHandler, SSHDetect
+from utils.logs import log_body
+from utils.metrics import SSH_PUSH_SECONDS
 
 logger = logging.getLogger("rag_api")
 
+PUSH_TIMEOUT = float(os.getenv("NOA_PUSH_TIMEOUT", "30"))
+SSH_PORT = int(os.getenv("NOA_SSH_PORT", "22"))
+SSH_POOL_ENABLED = os.getenv("NOA_SSH_POOL", "1") != "0"
+SSH_IDLE_TIMEOUT = float(os.getenv("NOA_SSH_IDLE_TIMEOUT", "120"))
+SSH_MAX_IDLE_PER_DEVICE = int(os.getenv("NOA_SSH_MAX_IDLE_PER_DEVICE", "2"))
+
 def get_device_type(vendor: str, model: str) -> str:
     vendor = vendor.lower()
     model = model.lower()
@@ -22,21 +32,175 @@ def get_device_type(vendor: str, model: str) -> str:
     else:
         return "autodetect"
 
-def push_config_to_device(device_ip, username, password, config_lines, vendor, model, device_name):
+# Autodetect opens its own session and probes the prompt with several show
+# commands, so the answer is remembered per device for the life of the process
+_detected_types = {}
+_detected_lock = threading.Lock()
+
+def resolve_device_type(device_ip, vendor, model, username, password, port=None, timeout=None):
     device_type = get_device_type(vendor, model)
+    if device_type != "autodetect":
+        return device_type
+    with _detected_lock:
+        if device_ip in _detected_types:
+            return _detected_types[device_ip]
+    logger.info(f"Autodetecting device type for {device_ip}")
+    guesser = SSHDetect(
+        device_type="autodetect",
+        host=device_ip,
+        username=username,
+        password=password,
+        port=port or SSH_PORT,
+        conn_timeout=timeout or PUSH_TIMEOUT
+    )
+    try:
+        detected = guesser.autodetect()
+    finally:
+        guesser.connection.disconnect()
+    if not detected:
+        raise ValueError(f"Unable to detect device type for {device_ip}")
+    with _detected_lock:
+        _detected_types[device_ip] = detected
+    return detected
+
+class SessionPool:
+    # Idle netmiko sessions keyed by (device_ip, device_type, username). A
+    # session is health-checked before reuse and closed after idle_timeout.
+    def __init__(self, idle_timeout=SSH_IDLE_TIMEOUT, max_idle_per_key=SSH_MAX_IDLE_PER_DEVICE):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_key = max_idle_per_key
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, key, connect):
+        while True:
+            with self._lock:
+                sessions = self._idle.get(key)
+                connection = sessions.pop()[1] if sessions else None
+            if connection is None:
+                break
+            if self._healthy(connection):
+                with self._lock:
+                    self.reused += 1
+                return connection, True
+            self._close(connection)
+        connection = connect()
+        with self._lock:
+            self.created += 1
+        return connection, False
+
+    def release(self, key, connection):
+        with self._lock:
+            sessions = self._idle.setdefault(key, [])
+            if len(sessions) < self.max_idle_per_key:
+                sessions.append((time.monotonic(), connection))
+                connection = None
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_forever, name="ssh-pool-reaper", daemon=True)
+                self._reaper.start()
+        if connection is not None:
+            self._close(connection)
+
+    def discard(self, connection):
+        self._close(connection)
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            for key, sessions in list(self._idle.items()):
+                expired.extend(connection for last_used, connection in sessions if last_used < cutoff)
+                sessions[:] = [(last_used, connection) for last_used, connection in sessions if last_used >= cutoff]
+                if not sessions:
+                    del self._idle[key]
+        for connection in expired:
+            self._close(connection)
+        return len(expired)
+
+    def close_all(self):
+        with self._lock:
+            sessions = [connection for entries in self._idle.values() for _, connection in entries]
+            self._idle.clear()
+        for connection in sessions:
+            self._close(connection)
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 2, 1))
+            self.evict_idle()
+
+    @staticmethod
+    def _healthy(connection):
+        try:
+            return connection.is_alive()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.disconnect()
+        except Exception:
+            pass
+
+session_pool = SessionPool()
+
+def push_config(device_ip, username, password, config_lines, vendor, model, device_name, timeout=None, port=None):
+    timeout = timeout or PUSH_TIMEOUT
     logger.info(f"Pushing config to {device_name} ({device_ip})")
+    start = time.perf_counter()
+    device_type = "unknown"
     try:
-        connection = ConnectHandler(
-            device_type=device_type,
-            ip=device_ip,
-            username=username,
-            password=password
-        )
-        output = connection.send_config_set(config_lines.splitlines())
-        connection.disconnect()
-        logger.info("Push successful:\n" + output)
-        return True
+        device_type = resolve_device_type(device_ip, vendor, model, username, password, port, timeout)
+        key = (device_ip, device_type, username)
+
+        def connect():
+            return ConnectHandler(
+                device_type=device_type,
+                ip=device_ip,
+                username=username,
+                password=password,
+                port=port or SSH_PORT,
+                conn_timeout=timeout,
+                auth_timeout=timeout,
+                banner_timeout=timeout
+            )
+
+        connection, reused = session_pool.acquire(key, connect) if SSH_POOL_ENABLED else (connect(), False)
+        if reused:
+            # A pooled session can die between the health check and use.
+            # Probed before any line is sent, so reconnecting is safe.
+            try:
+                connection.find_prompt()
+            except Exception:
+                session_pool.discard(connection)
+                logger.info(f"Pooled session to {device_ip} failed, reconnecting")
+                connection = connect()
+        try:
+            output = connection.send_config_set(config_lines.splitlines(), read_timeout=timeout)
+        except Exception as e:
+            session_pool.discard(connection)
+            # Never resent: lines already applied (ACL entries, no ...) would
+            # be applied twice
+            raise RuntimeError(f"push interrupted, the config may be partially applied: {e}") from e
+        if SSH_POOL_ENABLED:
+            session_pool.release(key, connection)
+        else:
+            connection.disconnect()
+        log_body(logger, "Push successful", output)
+        SSH_PUSH_SECONDS.observe(time.perf_counter() - start, device_type=device_type, outcome="ok")
+        return True, output
     except Exception as e:
         logger.error(f"Push failed: {e}")
-        return False
-		
+        SSH_PUSH_SECONDS.observe(time.perf_counter() - start, device_type=device_type, outcome="error")
+        return False, str(e)
+
+def push_config_to_device(device_ip, username, password, config_lines, vendor, model, device_name):
+    success, _ = push_config(device_ip, username, password, config_lines, vendor, model, device_name)
+    return success
+
+def close_sessions():
+    session_pool.close_all()
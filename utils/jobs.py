@@ -0,0 +1,207 @@
+#jobs.py
+
+import asyncio
+import logging
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from models.config_request import ConfigRequest
+from utils.blobs import drop_unreferenced, put_blob
+from utils.cache import generation_cache
+from utils.database import get_connection
+from utils.metrics import DB_WRITE_SECONDS
+from utils.ollama import build_prompt, call_ollama, generation_failed, select_examples
+from utils.query import query_weighted_entries
+
+logger = logging.getLogger("rag_api")
+
+GENERATION_WORKERS = int(os.getenv("NOA_GENERATION_WORKERS", "4"))
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("NOA_JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("NOA_JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("NOA_JOB_RETRY_DELAY", "10"))
+JOB_POLL_INTERVAL = float(os.getenv("NOA_JOB_POLL_INTERVAL", "2"))
+
+# Webhook jobs live in staging_queue itself:
+#   queued -> generating -> pending (ready for review) | failed
+# A worker claims a job by moving it to 'generating' and setting locked_until
+# to now + visibility timeout. A worker that dies leaves the lease to expire,
+# after which any worker picks the job up again. Failed attempts go back to
+# 'queued' with locked_until pushed out by the retry delay. A claim counts as
+# an attempt, so a job whose lease expired JOB_MAX_ATTEMPTS times (it keeps
+# killing its worker) is not reclaimed but swept to 'failed'.
+CLAIM_JOB_SQL = """
+    UPDATE staging_queue
+    SET status = 'generating', locked_until = ?, attempts = attempts + 1
+    WHERE id = (
+        SELECT id FROM staging_queue
+        WHERE status IN ('queued', 'generating') AND COALESCE(locked_until, 0) <= ? AND attempts < ?
+        ORDER BY priority DESC, id
+        LIMIT 1
+    )
+    RETURNING *
+"""
+
+EXHAUSTED_JOBS_SQL = """
+    UPDATE staging_queue
+    SET status = 'failed', locked_until = NULL,
+        last_error = 'Lease expired after ' || attempts || ' attempts: ' || COALESCE(last_error, 'worker lost')
+    WHERE status IN ('queued', 'generating') AND COALESCE(locked_until, 0) <= ? AND attempts >= ?
+"""
+
+JOB_STATUS_SQL = """
+    SELECT sq.id, sq.status, sq.priority, sq.attempts, sq.last_error,
+           unpack_blob(b.codec, b.data) AS generated_config,
+           sq.vendor, sq.model, sq.os_version, sq.feature, sq.device_ip, sq.device_name, sq.created_at
+    FROM staging_queue sq
+    LEFT JOIN blobs b ON b.hash = sq.config_hash
+    WHERE sq.id = ?
+"""
+
+@DB_WRITE_SECONDS.time(op="enqueue_job")
+def enqueue_job(request, priority=0, db_path="staging_queue.db"):
+    conn = get_connection(db_path)
+    with conn:
+        cursor = conn.execute("""
+            INSERT INTO staging_queue (
+                vendor, model, os_version, feature, parameters,
+                status, device_ip, device_name, priority
+            ) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)
+        """, (
+            request.vendor, request.model, request.os_version,
+            request.feature, request.parameters,
+            request.device_ip, request.device_name, priority
+        ))
+    return cursor.lastrowid
+
+@DB_WRITE_SECONDS.time(op="claim_job")
+def claim_job(db_path="staging_queue.db", visibility_timeout=None):
+    now = time.time()
+    lease = now + (visibility_timeout or JOB_VISIBILITY_TIMEOUT)
+    conn = get_connection(db_path)
+    with conn:
+        swept = conn.execute(EXHAUSTED_JOBS_SQL, (now, JOB_MAX_ATTEMPTS)).rowcount
+        row = conn.execute(CLAIM_JOB_SQL, (lease, now, JOB_MAX_ATTEMPTS)).fetchone()
+    if swept:
+        logger.warning(f"Marked {swept} job(s) failed after {JOB_MAX_ATTEMPTS} expired leases")
+    return dict(row) if row else None
+
+@DB_WRITE_SECONDS.time(op="complete_job")
+def complete_job(job, generated_config, db_path="staging_queue.db"):
+    # The lease value doubles as the claim token: if the lease expired and
+    # another worker took the job over, this late result is dropped
+    conn = get_connection(db_path)
+    with conn:
+        config_hash = put_blob(conn, generated_config)
+        cursor = conn.execute("""
+            UPDATE staging_queue
+            SET config_hash = ?, status = 'pending', locked_until = NULL, last_error = NULL
+            WHERE id = ? AND status = 'generating' AND locked_until = ?
+        """, (config_hash, job["id"], job["locked_until"]))
+        if cursor.rowcount != 1:
+            drop_unreferenced(conn, config_hash)
+    return cursor.rowcount == 1
+
+@DB_WRITE_SECONDS.time(op="fail_job")
+def fail_job(job, error, retry=True, db_path="staging_queue.db"):
+    retry = retry and job["attempts"] < JOB_MAX_ATTEMPTS
+    status = "queued" if retry else "failed"
+    retry_at = time.time() + JOB_RETRY_DELAY * job["attempts"] if retry else None
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("""
+            UPDATE staging_queue
+            SET status = ?, locked_until = ?, last_error = ?
+            WHERE id = ? AND status = 'generating' AND locked_until = ?
+        """, (status, retry_at, error, job["id"], job["locked_until"]))
+    return status
+
+def get_job(job_id, db_path="staging_queue.db"):
+    conn = get_connection(db_path)
+    row = conn.execute(JOB_STATUS_SQL, (job_id,)).fetchone()
+    return dict(row) if row else None
+
+async def process_job(job, db_path="staging_queue.db"):
+    config_request = ConfigRequest(**job)
+    entries = await run_in_threadpool(
+        query_weighted_entries,
+        vendor=config_request.vendor,
+        model=config_request.model,
+        os_version=config_request.os_version,
+        feature=config_request.feature
+    )
+    if not entries:
+        status = await run_in_threadpool(fail_job, job, "No CLI examples found.", False, db_path)
+        logger.info(f"Job #{job['id']}: no CLI examples, {status}")
+        return
+    prompt = build_prompt(entries, config_request)
+    key = await run_in_threadpool(generation_cache.key_for, config_request, select_examples(entries))
+    generated_config = await run_in_threadpool(generation_cache.get, key)
+    if generated_config is None:
+        generated_config = await call_ollama(prompt, vendor=config_request.vendor, feature=config_request.feature, model=config_request.model)
+        if generation_failed(generated_config):
+            status = await run_in_threadpool(fail_job, job, generated_config, True, db_path)
+            logger.warning(f"Job #{job['id']} attempt {job['attempts']} failed: {generated_config} ({status})")
+            return
+        await run_in_threadpool(generation_cache.set, key, generated_config)
+    if await run_in_threadpool(complete_job, job, generated_config, db_path):
+        logger.info(f"Job #{job['id']} generated, ready for review")
+    else:
+        logger.warning(f"Job #{job['id']} finished after its lease expired, result dropped")
+
+class GenerationWorkers:
+    # A fixed number of asyncio workers draining staging_queue. Generation is
+    # I/O bound on Ollama, so tasks on the API's event loop are enough; the
+    # SQLite calls go through the threadpool.
+    def __init__(self, workers=GENERATION_WORKERS, db_path="staging_queue.db", poll_interval=JOB_POLL_INTERVAL):
+        self.workers = workers
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self._wakeup = None
+        self._tasks = []
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(n)) for n in range(self.workers)]
+        logger.info(f"Started {self.workers} generation workers")
+
+    def notify(self):
+        # Called after enqueueing so an idle worker does not wait out its poll
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, worker_id):
+        while True:
+            # Cleared before the claim, not after an empty one: a notify()
+            # landing during the claim then still wakes the wait below. The
+            # job it announces is committed, so the claim after any clear
+            # sees it.
+            self._wakeup.clear()
+            try:
+                job = await run_in_threadpool(claim_job, self.db_path)
+            except Exception as e:
+                logger.error(f"Generation worker {worker_id}: claim failed: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await process_job(job, self.db_path)
+            except asyncio.CancelledError:
+                # Shutdown mid-job: the lease expires and the job is picked up again
+                raise
+            except Exception as e:
+                logger.error(f"Job #{job['id']} crashed: {e}")
+                await run_in_threadpool(fail_job, job, str(e), True, self.db_path)
+
+generation_workers = GenerationWorkers()
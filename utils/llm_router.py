@@ -0,0 +1,180 @@
+#llm_router.py
+
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from utils.metrics import LLM_GENERATION_SECONDS
+
+logger = logging.getLogger("rag_api")
+
+# Backends and routes are JSON, inline or as a path to a file:
+#   NOA_LLM_BACKENDS='[{"name": "gpu1", "url": "http://10.0.0.5:11434", "model": "mistral"},
+#                      {"name": "gpu2", "url": "http://10.0.0.6:11434", "model": "mixtral"}]'
+#   NOA_LLM_ROUTES='[{"vendor": "fortigate", "feature": "policy", "model": "mixtral"},
+#                    {"feature": "vlan", "backends": ["gpu1"]}]'
+# Route vendor/feature values match as case-insensitive substrings, first
+# match wins. Without NOA_LLM_BACKENDS the single OLLAMA_URL/OLLAMA_MODEL
+# backend is used.
+LLM_BACKENDS = os.getenv("NOA_LLM_BACKENDS", "")
+LLM_ROUTES = os.getenv("NOA_LLM_ROUTES", "")
+BREAKER_FAILURES = int(os.getenv("NOA_BREAKER_FAILURES", "3"))
+BREAKER_RESET = float(os.getenv("NOA_BREAKER_RESET", "30"))
+LATENCY_WINDOW = 500
+
+class NoBackendAvailable(Exception):
+    pass
+
+class CircuitBreaker:
+    # closed: requests flow. open: the backend is skipped until reset_timeout
+    # has passed, then exactly one probe request is let through; its outcome
+    # closes the breaker again or re-opens it for another reset_timeout.
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def available(self):
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def acquire(self):
+        if self.opened_at is not None:
+            self._probing = True
+
+    def release(self):
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+class Backend:
+    def __init__(self, name, url, model):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.model = model
+        self.breaker = CircuitBreaker()
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @asynccontextmanager
+    async def track(self):
+        # Counts the request as outstanding and feeds the outcome to the
+        # breaker. The caller raises for backend failures; cancellation is
+        # neither a success nor a failure.
+        self.breaker.acquire()
+        self.outstanding += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.failures += 1
+            self.breaker.record_failure()
+            LLM_GENERATION_SECONDS.observe(time.perf_counter() - start, backend=self.name, outcome="error")
+            raise
+        except BaseException:
+            self.breaker.release()
+            LLM_GENERATION_SECONDS.observe(time.perf_counter() - start, backend=self.name, outcome="cancelled")
+            raise
+        else:
+            self.latencies.append(time.perf_counter() - start)
+            self.breaker.record_success()
+            LLM_GENERATION_SECONDS.observe(self.latencies[-1], backend=self.name, outcome="ok")
+        finally:
+            self.outstanding -= 1
+            self.requests += 1
+
+    def mean_latency(self):
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def stats(self):
+        ordered = sorted(self.latencies)
+
+        def percentile(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 4) if ordered else None
+
+        return {
+            "name": self.name, "url": self.url, "model": self.model,
+            "state": self.breaker.state, "outstanding": self.outstanding,
+            "requests": self.requests, "failures": self.failures,
+            "latency_mean": round(self.mean_latency(), 4),
+            "latency_p50": percentile(0.5), "latency_p95": percentile(0.95), "latency_p99": percentile(0.99)
+        }
+
+class LLMRouter:
+    def __init__(self, backends, routes=None):
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        self.backends = backends
+        self.routes = routes or []
+
+    def candidates(self, vendor=None, feature=None):
+        vendor = (vendor or "").strip().lower()
+        feature = (feature or "").strip().lower()
+        for route in self.routes:
+            if route.get("vendor", "").lower() not in vendor or route.get("feature", "").lower() not in feature:
+                continue
+            matched = [
+                backend for backend in self.backends
+                if backend.name in route.get("backends", []) or backend.model == route.get("model")
+            ]
+            if matched:
+                return matched
+            logger.warning(f"Route {route} matches no configured backend, using all backends")
+            break
+        return self.backends
+
+    def pick(self, vendor=None, feature=None, exclude=()):
+        # Least outstanding requests among backends whose breaker lets a
+        # request through, ties broken by recent mean latency. A route whose
+        # backends are all unavailable falls back to the rest of the pool.
+        routed = self.candidates(vendor, feature)
+        for pool in (routed, self.backends):
+            available = [b for b in pool if b.name not in exclude and b.breaker.available()]
+            if available:
+                if pool is not routed:
+                    logger.warning(f"No routed backend available for {vendor}/{feature}, falling back")
+                return min(available, key=lambda b: (b.outstanding, b.mean_latency()))
+        return None
+
+    def stats(self):
+        return [backend.stats() for backend in self.backends]
+
+def _load_json(value):
+    if not value:
+        return None
+    if os.path.isfile(value):
+        with open(value) as f:
+            return json.load(f)
+    return json.loads(value)
+
+def build_router(default_url, default_model):
+    configured = _load_json(LLM_BACKENDS) or [{"name": "default", "url": default_url, "model": default_model}]
+    backends = [
+        Backend(item.get("name") or f"backend{n}", item.get("url", default_url), item.get("model", default_model))
+        for n, item in enumerate(configured)
+    ]
+    return LLMRouter(backends, _load_json(LLM_ROUTES))
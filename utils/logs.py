@@ -0,0 +1,94 @@
+#logs.py
+
+import atexit
+import hashlib
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+from utils.metrics import LOG_RECORDS_DROPPED
+
+LOG_FILE = os.getenv("NOA_LOG_FILE", "noa.log")
+LOG_LEVEL = os.getenv("NOA_LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("NOA_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("NOA_LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("NOA_LOG_QUEUE_SIZE", "10000"))
+LOG_BODY_CHARS = int(os.getenv("NOA_LOG_BODY_CHARS", "400"))
+# Fraction of prompts/responses written whole to the capture file, for
+# debugging generation quality without logging every body
+LOG_CAPTURE_RATE = float(os.getenv("NOA_LOG_CAPTURE_RATE", "0"))
+LOG_CAPTURE_FILE = os.getenv("NOA_LOG_CAPTURE_FILE", "noa_capture.log")
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+CAPTURE_LOGGER = "rag_api.capture"
+capture_logger = logging.getLogger(CAPTURE_LOGGER)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # The request path only formats the record and puts it on a bounded
+    # queue; file I/O happens on the listener thread. When the writer falls
+    # that far behind, records are dropped rather than blocking requests.
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+_listener = None
+
+def configure_logging():
+    # Replaces logging.basicConfig for the API: root logs through the queue,
+    # the listener writes noa.log (rotated) and the console, and sampled
+    # full bodies go to their own rotated capture file
+    global _listener
+    if _listener is not None:
+        return _listener
+    formatter = logging.Formatter(LOG_FORMAT)
+    is_capture = lambda record: record.name == CAPTURE_LOGGER
+
+    file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    console_handler = logging.StreamHandler(sys.stderr)
+    capture_handler = logging.handlers.RotatingFileHandler(
+        LOG_CAPTURE_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, delay=True
+    )
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+        handler.addFilter(lambda record: not is_capture(record))
+    capture_handler.setFormatter(formatter)
+    capture_handler.addFilter(is_capture)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    capture_logger.setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, capture_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+def body_digest(text):
+    return hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()[:12]
+
+def log_body(logger, label, text, level=logging.INFO):
+    # Short bodies are logged as they are. Longer ones are cut to
+    # LOG_BODY_CHARS and tagged with their length and a hash, which is also
+    # the key of the full text in the capture file when it was sampled.
+    if text is None or not logger.isEnabledFor(level):
+        return
+    captured = LOG_CAPTURE_RATE > 0 and random.random() < LOG_CAPTURE_RATE
+    if len(text) <= LOG_BODY_CHARS and not captured:
+        logger.log(level, "%s:\n%s", label, text)
+        return
+    digest = body_digest(text)
+    if captured:
+        capture_logger.info("%s sha256:%s\n%s", label, digest, text)
+    logger.log(
+        level, "%s (%d chars, sha256:%s%s):\n%s%s", label, len(text), digest,
+        ", captured" if captured else "", text[:LOG_BODY_CHARS], "..." if len(text) > LOG_BODY_CHARS else ""
+    )
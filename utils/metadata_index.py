@@ -0,0 +1,127 @@
+#metadata_index.py
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from utils.database import get_connection
+
+logger = logging.getLogger("rag_api")
+
+MATCH_CUTOFF = float(os.getenv("NOA_METADATA_CUTOFF", "0.5"))
+REFRESH_INTERVAL = float(os.getenv("NOA_METADATA_REFRESH", "5"))
+
+def _normalize(text):
+    return (text or "").strip().lower()
+
+def _feature_key(feature):
+    # Same suffix stripping as the old feature_map: CISCO_NEXUS_9300_VLAN -> vlan
+    return _normalize(feature).split("_")[-1]
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class NgramMatcher:
+    def __init__(self, values, key=_normalize):
+        self.exact = {}
+        self.grams = []
+        self.postings = {}
+        for value in values:
+            normalized = key(value)
+            if not normalized or normalized in self.exact:
+                continue
+            self.exact[normalized] = value
+            grams = _trigrams(normalized)
+            slot = len(self.grams)
+            self.grams.append((normalized, grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(slot)
+
+    def match(self, text, cutoff=MATCH_CUTOFF):
+        if text in self.exact:
+            return self.exact[text]
+        grams = _trigrams(text)
+        overlap = {}
+        for gram in grams:
+            for slot in self.postings.get(gram, ()):
+                overlap[slot] = overlap.get(slot, 0) + 1
+        best, best_score = None, cutoff
+        for slot, shared in overlap.items():
+            normalized, candidate_grams = self.grams[slot]
+            score = 2.0 * shared / (len(grams) + len(candidate_grams))
+            if score >= best_score:
+                best, best_score = normalized, score
+        return self.exact[best] if best is not None else None
+
+class MetadataIndex:
+    def __init__(self, rows=(), version=0):
+        self.version = version
+        rows = list(rows)
+        self.vendors = NgramMatcher(row[0] for row in rows)
+        self.models = NgramMatcher(row[1] for row in rows)
+        self.os_versions = NgramMatcher(row[2] for row in rows)
+        self.features = NgramMatcher((row[3] for row in rows), key=_feature_key)
+        vendor_features = {}
+        for vendor, _, _, feature in rows:
+            vendor_features.setdefault(_normalize(vendor), []).append(feature)
+        self.vendor_features = {
+            vendor: NgramMatcher(features, key=_feature_key)
+            for vendor, features in vendor_features.items()
+        }
+
+    def resolve(self, vendor, model, os_version, feature):
+        best_vendor = self.vendors.match(_normalize(vendor))
+        best_model = self.models.match(_normalize(model))
+        best_os_version = self.os_versions.match(_normalize(os_version))
+        feature_key = _feature_key(feature)
+        best_feature = None
+        if best_vendor is not None:
+            best_feature = self.vendor_features[_normalize(best_vendor)].match(feature_key)
+        if best_feature is None:
+            best_feature = self.features.match(feature_key)
+        return best_vendor, best_model, best_os_version, best_feature
+
+def library_version(db_path="cli_library.db"):
+    conn = get_connection(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(SUM(version), 0) FROM cli_library_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+def load_metadata_index(db_path="cli_library.db"):
+    version = library_version(db_path)
+    conn = get_connection(db_path)
+    try:
+        rows = conn.execute("SELECT DISTINCT vendor, model, os_version, feature FROM cli_library").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    logger.info(f"Metadata index loaded: {len(rows)} vendor/model/os/feature combinations")
+    return MetadataIndex(rows, version)
+
+_indexes = {}
+_checked_at = {}
+_lock = threading.Lock()
+
+def get_metadata_index(db_path="cli_library.db"):
+    # Resolution is served from memory; the library version is only polled
+    # every REFRESH_INTERVAL seconds to pick up changes from parse_cli_file.py
+    now = time.monotonic()
+    index = _indexes.get(db_path)
+    if index is not None and now - _checked_at.get(db_path, 0) < REFRESH_INTERVAL:
+        return index
+    with _lock:
+        index = _indexes.get(db_path)
+        if index is None or library_version(db_path) != index.version:
+            index = load_metadata_index(db_path)
+            _indexes[db_path] = index
+        _checked_at[db_path] = now
+        return index
+
+def refresh_metadata_index(db_path="cli_library.db"):
+    with _lock:
+        _indexes[db_path] = load_metadata_index(db_path)
+        _checked_at[db_path] = time.monotonic()
+        return _indexes[db_path]
@@ -0,0 +1,157 @@
+#metrics.py
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Counters and histograms rendered in the Prometheus text format at
+# GET /metrics. Kept in-process and dependency-free: an observation is a
+# lock, a bisect and three additions, cheap enough for every request.
+# Histograms take fixed buckets, p50/p95/p99 come from histogram_quantile()
+# on the Prometheus side.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {_format(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts, the +Inf bucket last; cumulated on render
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        # Also usable as a decorator. An exception is still observed, under
+        # outcome="error" when the histogram has an outcome label.
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            if "outcome" in self.labels:
+                labels = {**labels, "outcome": outcome}
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = f'le="{_format(float(bound)) if bound != float("inf") else "+Inf"}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_format(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+        return lines
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "noa_http_request_seconds", "HTTP request latency by route template, until the response is fully sent",
+    ["method", "route", "status"]
+)
+RETRIEVAL_SECONDS = Histogram("noa_retrieval_seconds", "CLI example retrieval", ["source"])
+PROMPT_BUILD_SECONDS = Histogram("noa_prompt_build_seconds", "Prompt packing and layout")
+LLM_FIRST_TOKEN_SECONDS = Histogram("noa_llm_first_token_seconds", "Time to the first generated token", ["backend"])
+LLM_GENERATION_SECONDS = Histogram("noa_llm_generation_seconds", "Whole LLM request per backend", ["backend", "outcome"])
+DB_WRITE_SECONDS = Histogram("noa_db_write_seconds", "staging_queue.db writes", ["op", "outcome"])
+SSH_PUSH_SECONDS = Histogram("noa_ssh_push_seconds", "Config push over SSH", ["device_type", "outcome"])
+GENERATION_CACHE = Counter("noa_generation_cache_total", "Generation cache lookups", ["result"])
+CONFIG_VALIDATION = Counter("noa_config_validation_total", "Generated configs checked by the syntax linter", ["family", "result"])
+CONFIG_VALIDATION_SECONDS = Histogram(
+    "noa_config_validation_seconds", "Syntax check of one generated config", ["family"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+)
+LOG_RECORDS_DROPPED = Counter("noa_log_records_dropped_total", "Log records dropped because the log queue was full")
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware: no extra task per request
+    # and streamed responses are timed to their last chunk. Routes are
+    # labelled by template (/review/{id}) so ids do not explode the series.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status[0]
+            )
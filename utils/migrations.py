@@ -0,0 +1,281 @@
+#migrations.py
+
+import logging
+import os
+from collections import Counter
+
+logger = logging.getLogger("rag_api")
+
+# Each database file tracks the last applied step in PRAGMA user_version.
+# Steps are (version, description, [statements]) and are applied in order,
+# each inside its own transaction. A statement may also be a callable taking
+# the connection, for backfills. Never edit a released step, add a new one.
+
+def _normalized_columns(table):
+    return [
+        f"ALTER TABLE {table} ADD COLUMN vendor_n TEXT GENERATED ALWAYS AS (lower(trim(vendor))) VIRTUAL",
+        f"ALTER TABLE {table} ADD COLUMN model_n TEXT GENERATED ALWAYS AS (lower(trim(model))) VIRTUAL",
+        f"ALTER TABLE {table} ADD COLUMN os_n TEXT GENERATED ALWAYS AS (lower(trim(os_version))) VIRTUAL",
+        f"ALTER TABLE {table} ADD COLUMN feature_n TEXT GENERATED ALWAYS AS (lower(trim(feature))) VIRTUAL",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_normalized ON {table} (vendor_n, model_n, os_n, feature_n)",
+    ]
+
+def _backfill_feedback_scores(conn):
+    from utils.database import accumulate_feedback_score
+    # Scores are written in log space (step 7); before that step the table
+    # has no log_score column and step 7 replays the log instead
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(feedback_score)").fetchall()}
+    if "log_score" not in columns:
+        return
+    rows = conn.execute("""
+        SELECT request_id, status, CAST(strftime('%s', timestamp) AS REAL)
+        FROM feedback_log ORDER BY id
+    """).fetchall()
+    for request_id, status, timestamp in rows:
+        accumulate_feedback_score(conn, request_id, status, timestamp)
+
+def _backfill_content_hashes(conn):
+    from utils.database import content_hash
+    rows = conn.execute("SELECT id, vendor, model, os_version, feature, cli_block FROM cli_library").fetchall()
+    conn.executemany(
+        "UPDATE cli_library SET content_hash = ? WHERE id = ?",
+        [(content_hash(*row[1:]), row[0]) for row in rows]
+    )
+
+BLOB_REFERENCES = (("staging_queue", "config_hash"), ("feedback_log", "config_hash"), ("feedback_log", "prompt_hash"))
+
+def _blob_refcount_triggers(table, column):
+    release = f"""
+        UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.{column};
+        DELETE FROM blobs WHERE hash = OLD.{column} AND refcount <= 0;
+    """
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_{column}_insert_ref
+        AFTER INSERT ON {table} WHEN NEW.{column} IS NOT NULL
+        BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.{column};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_{column}_update_ref
+        AFTER UPDATE OF {column} ON {table} WHEN OLD.{column} IS NOT NEW.{column}
+        BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.{column};
+            {release}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_{column}_delete_ref
+        AFTER DELETE ON {table} WHEN OLD.{column} IS NOT NULL
+        BEGIN
+            {release}
+        END
+        """,
+    ]
+
+def _backfill_blobs(conn):
+    # Moves the text columns into blobs; runs before the refcount triggers
+    # exist, so the counts are set here in one go
+    from utils.blobs import put_blob
+    refs = Counter()
+    for table, source, column in (
+        ("staging_queue", "generated_config", "config_hash"),
+        ("feedback_log", "generated_config", "config_hash"),
+        ("feedback_log", "prompt", "prompt_hash"),
+    ):
+        rows = conn.execute(f"SELECT id, {source} FROM {table} WHERE {source} IS NOT NULL").fetchall()
+        updates = []
+        for row_id, text in rows:
+            digest = put_blob(conn, text)
+            refs[digest] += 1
+            updates.append((digest, row_id))
+        conn.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)
+    conn.executemany("UPDATE blobs SET refcount = ? WHERE hash = ?", [(count, digest) for digest, count in refs.items()])
+
+STAGING_MIGRATIONS = [
+    (1, "normalized lookup columns and hot-path indexes", _normalized_columns("staging_queue") + [
+        "CREATE INDEX IF NOT EXISTS idx_staging_queue_status_created ON staging_queue (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_staging_queue_created ON staging_queue (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_log_request ON feedback_log (request_id)",
+    ]),
+    (2, "materialized per-request feedback score", [
+        """
+        CREATE TABLE IF NOT EXISTS feedback_score (
+            request_id INTEGER PRIMARY KEY,
+            score REAL NOT NULL DEFAULT 0,
+            events INTEGER NOT NULL DEFAULT 0,
+            last_status TEXT,
+            updated_at REAL
+        )
+        """,
+        _backfill_feedback_scores,
+    ]),
+    (3, "batch push progress and per-device results", [
+        """
+        CREATE TABLE IF NOT EXISTS push_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            requested_by TEXT,
+            status TEXT DEFAULT 'queued',
+            total INTEGER DEFAULT 0,
+            done INTEGER DEFAULT 0,
+            succeeded INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS push_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch_id INTEGER,
+            request_id INTEGER,
+            device_ip TEXT,
+            device_name TEXT,
+            status TEXT,
+            output TEXT,
+            duration REAL,
+            finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_push_results_batch ON push_results (batch_id)",
+    ]),
+    (4, "webhook generation jobs", [
+        "ALTER TABLE staging_queue ADD COLUMN priority INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE staging_queue ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE staging_queue ADD COLUMN locked_until REAL",
+        "ALTER TABLE staging_queue ADD COLUMN last_error TEXT",
+        # No new index: the claim query finds unfinished jobs through the
+        # status index
+    ]),
+    (5, "keyset pagination and list filters", [
+        # SQLite appends the rowid to every index, so single-column indexes
+        # give filter + ORDER BY id in one pass and cover COUNT(*)
+        "CREATE INDEX IF NOT EXISTS idx_staging_queue_status ON staging_queue (status)",
+        "CREATE INDEX IF NOT EXISTS idx_staging_queue_vendor ON staging_queue (vendor_n)",
+        "CREATE INDEX IF NOT EXISTS idx_staging_queue_status_vendor ON staging_queue (status, vendor_n)",
+        "CREATE INDEX IF NOT EXISTS idx_staging_queue_device_name ON staging_queue (device_name)",
+        "CREATE INDEX IF NOT EXISTS idx_staging_queue_device_ip ON staging_queue (device_ip)",
+        # Superseded by idx_staging_queue_status, lists no longer sort by created_at
+        "DROP INDEX IF EXISTS idx_staging_queue_status_created",
+        # Filters combine (pending + device); without statistics the planner
+        # picks the broad status index over the selective device one
+        "ANALYZE staging_queue",
+    ]),
+    (6, "content-addressed compressed blobs for configs and prompts", [
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            data BLOB NOT NULL
+        )
+        """,
+        "ALTER TABLE staging_queue ADD COLUMN config_hash TEXT",
+        "ALTER TABLE feedback_log ADD COLUMN config_hash TEXT",
+        "ALTER TABLE feedback_log ADD COLUMN prompt_hash TEXT",
+        # New feedback rows reference the examples and request the prompt was
+        # built from instead of keeping the rendered text
+        "ALTER TABLE feedback_log ADD COLUMN prompt_ref TEXT",
+        _backfill_blobs,
+        "ALTER TABLE staging_queue DROP COLUMN generated_config",
+        "ALTER TABLE feedback_log DROP COLUMN generated_config",
+        "ALTER TABLE feedback_log DROP COLUMN prompt",
+        # The freed pages are reused by new rows; run VACUUM by hand to give
+        # the space back to the file system
+    ] + [trigger for table, column in BLOB_REFERENCES for trigger in _blob_refcount_triggers(table, column)]),
+    (7, "feedback scores in log space", [
+        # The epoch-scaled score grows as 2^(t / half_life) and overflows;
+        # rebuild the scores from the log in the new form
+        "ALTER TABLE feedback_score ADD COLUMN log_score REAL",
+        "ALTER TABLE feedback_score DROP COLUMN score",
+        "DELETE FROM feedback_score",
+        _backfill_feedback_scores,
+    ]),
+]
+
+def _backfill_source_paths(conn):
+    # Rows only carried their file's basename. They go to the manifest path
+    # when exactly one ingested file has that name; files sharing a name lose
+    # their manifest entry instead, so the next run re-parses them and takes
+    # their blocks back.
+    by_name = {}
+    for (path,) in conn.execute("SELECT path FROM ingestion_manifest").fetchall():
+        by_name.setdefault(os.path.basename(path), []).append(path)
+    for name, paths in by_name.items():
+        if len(paths) == 1:
+            conn.execute("UPDATE cli_library SET source_path = ? WHERE source = ?", (paths[0], name))
+        else:
+            conn.executemany("DELETE FROM ingestion_manifest WHERE path = ?", [(path,) for path in paths])
+
+LIBRARY_MIGRATIONS = [
+    (1, "normalized lookup columns", _normalized_columns("cli_library")),
+    (2, "unique content hash for bulk ingestion", [
+        "ALTER TABLE cli_library ADD COLUMN content_hash TEXT",
+        _backfill_content_hashes,
+        "DELETE FROM cli_library WHERE id NOT IN (SELECT MIN(id) FROM cli_library GROUP BY content_hash)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cli_library_content_hash ON cli_library (content_hash)",
+    ]),
+    (3, "ingestion manifest for incremental re-ingestion", [
+        """
+        CREATE TABLE IF NOT EXISTS ingestion_manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            content_hash TEXT,
+            blocks INTEGER,
+            ingested_at REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_cli_library_source ON cli_library (source)",
+    ]),
+    (4, "ingested file path per block for the section diff", [
+        "ALTER TABLE cli_library ADD COLUMN source_path TEXT",
+        _backfill_source_paths,
+        "CREATE INDEX IF NOT EXISTS idx_cli_library_source_path ON cli_library (source_path)",
+    ]),
+    (5, "library identity for the vector index", [
+        # A deleted and re-ingested library reuses ids for other blocks; the
+        # vector index file records this token and is rebuilt when it differs
+        """
+        CREATE TABLE IF NOT EXISTS library_identity (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            token TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO library_identity (id, token, created_at)
+        VALUES (1, lower(hex(randomblob(16))), CAST(strftime('%s', 'now') AS REAL))
+        """,
+    ]),
+]
+
+def apply_migrations(conn, migrations):
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, description, statements in migrations:
+        if version <= current:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+    return current
+
+def explain_query_plan(conn, sql, params=()):
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+def uses_index(plan):
+    # A plain "SCAN <table>" without an index is a full table scan
+    return all(" USING " in step or not step.startswith("SCAN") for step in plan)
@@ -1,58 +1,291 @@
 #ollama.py
 
-import requests
+import asyncio
+import hashlib
+import httpx
 import json
 import logging
+import os
 import re
-from tenacity import retry, stop_after_attempt, wait_fixed
+import time
+from types import SimpleNamespace
+from utils.blobs import get_blob
+from utils.database import get_connection
+from utils.llm_router import NoBackendAvailable, build_router
+from utils.logs import log_body
+from utils.metrics import LLM_FIRST_TOKEN_SECONDS, PROMPT_BUILD_SECONDS
+from utils.prompt import PROMPT_TOKEN_BUDGET, count_tokens, layout_prompt, pack_examples, repair_section
+from utils.validation import VALIDATION_MODE, VALIDATION_RETRIES, validate_config, validation_error
 
 logger = logging.getLogger("rag_api")
 
-def build_prompt(entries, request):
-    examples = "\n\n".join([entry[5] for entry in entries])
-    prompt = f"""You are a network assistant. Based on the following CLI examples:
-{examples}
-Generate a configuration for:
-- Vendor: {request.vendor}
-- Model: {request.model}
-- OS Version: {request.os_version}
-- Feature: {request.feature}
-- Parameters: {request.parameters}
-Respond only with the CLI configuration block using triple backticks.
-"""
-    logger.info("Generated Prompt:\n%s", prompt)
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "200"))
+# Keeps the model, and with it the cached prompt prefix, loaded between requests
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Failed generations move on to the next backend straight away instead of
+# sleeping and retrying the same one; open circuits are skipped
+LLM_MAX_ATTEMPTS = int(os.getenv("NOA_LLM_MAX_ATTEMPTS", "3"))
+
+llm_router = build_router(OLLAMA_URL, OLLAMA_MODEL)
+
+# One keep-alive pool shared by every request in the worker, across backends
+_client = None
+
+def get_client():
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+                keepalive_expiry=300
+            )
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def select_examples(entries):
+    return [entry[5] for entry in entries]
+
+def generation_failed(text):
+    return text.startswith("Error:") or text == "No response generated."
+
+@PROMPT_BUILD_SECONDS.time()
+def build_prompt(entries, request, token_budget=None):
+    # The examples get whatever the budget leaves after the fixed template
+    # and the request itself
+    token_budget = token_budget or PROMPT_TOKEN_BUDGET
+    base_tokens = count_tokens(layout_prompt(request, []))
+    examples, stats = pack_examples(entries, token_budget - base_tokens)
+    prompt = layout_prompt(request, examples)
+    logger.info(
+        f"Prompt uses ~{base_tokens + stats['tokens']}/{token_budget} tokens: "
+        f"{stats['used']}/{stats['candidates']} examples, {stats['duplicates']} near-duplicates dropped, "
+        f"{stats['over_budget']} over budget"
+    )
+    log_body(logger, "Generated prompt", prompt)
     return prompt
 
+def feedback_prompt(feedback_id, db_path="staging_queue.db", library_db_path="cli_library.db"):
+    # Rebuilt from the logged reference with the current layout. Rows logged
+    # before prompts were stored as references still carry the text.
+    conn = get_connection(db_path)
+    row = conn.execute("SELECT prompt_ref, prompt_hash FROM feedback_log WHERE id = ?", (feedback_id,)).fetchone()
+    if row is None:
+        return None
+    if row["prompt_ref"] is None:
+        return get_blob(conn, row["prompt_hash"])
+    reference = json.loads(row["prompt_ref"])
+    sources = {"staging_queue": db_path, "cli_library": library_db_path}
+    entries = []
+    for table, entry_id in reference["examples"]:
+        if table in sources:
+            entry = get_connection(sources[table]).execute(f"SELECT * FROM {table} WHERE id = ?", (entry_id,)).fetchone()
+            if entry is not None:
+                entries.append(entry)
+    return build_prompt(entries, SimpleNamespace(**reference["request"]), reference["budget"])
+
 def extract_cli_block(text):
     match = re.search(r"```(?:bash)?\n(.*?)```", text, re.DOTALL)
     if not match:
         match = re.search(r"```(.*?)```", text, re.DOTALL)
     return match.group(1).strip() if match else text.strip()
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def call_ollama(prompt):
-    try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "mistral", "prompt": prompt},
-            stream=True,
-            timeout=60
-        )
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Ollama request failed: {e}")
-        return "Error: Unable to reach Ollama."
+class CliBlockExtractor:
+    # Incremental counterpart of extract_cli_block for streamed responses:
+    # feed() returns the part of the first fenced block that became known
+    # with this token. A fence language tag (```bash) is skipped, and up to
+    # two trailing backticks are held back in case they start the closing
+    # fence. finish() returns what extract_cli_block makes of the whole text,
+    # which stays the authoritative result.
+    def __init__(self):
+        self.text = ""
+        self.state = "before"
+        self._pos = 0
+
+    def feed(self, token):
+        self.text += token
+        if self.state == "before":
+            fence = self.text.find("```")
+            newline = self.text.find("\n", fence + 3) if fence != -1 else -1
+            if newline == -1:
+                return ""
+            self.state = "inside"
+            self._pos = newline + 1
+        if self.state != "inside":
+            return ""
+        end = self.text.find("```", self._pos)
+        if end != -1:
+            self.state = "done"
+        else:
+            end = len(self.text)
+            while end > self._pos and self.text[end - 1] == "`":
+                end -= 1
+        delta = self.text[self._pos:end]
+        self._pos = end
+        return delta
+
+    def finish(self):
+        return extract_cli_block(self.text) if self.text else "No response generated."
+
+def generate_payload(prompt, context=None, model=None):
+    payload = {"model": model or OLLAMA_MODEL, "prompt": prompt, "keep_alive": OLLAMA_KEEP_ALIVE}
+    # A context handle from an earlier response continues that conversation
+    if context:
+        payload["context"] = context
+    return payload
 
+async def _stream_backend(backend, prompt, context=None, state=None):
+    start = time.perf_counter()
+    first_token = True
+    async with get_client().stream(
+        "POST",
+        f"{backend.url}/api/generate",
+        json=generate_payload(prompt, context, backend.model)
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                try:
+                    obj = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if obj.get("response"):
+                    if first_token:
+                        first_token = False
+                        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, backend=backend.name)
+                    yield obj["response"]
+                if obj.get("done") and state is not None:
+                    state.update({key: obj[key] for key in ("context", "prompt_eval_count", "prompt_eval_duration") if key in obj})
+
+async def stream_ollama(prompt, context=None, state=None, vendor=None, feature=None):
+    # Yields response fragments as Ollama's NDJSON lines arrive. The final
+    # line's context handle and timings are left in state when one is given.
+    # Tokens may already be with the client, so a stream does not fail over.
+    backend = llm_router.pick(vendor, feature)
+    if backend is None:
+        raise NoBackendAvailable("No LLM backend available")
+    async with backend.track():
+        async for token in _stream_backend(backend, prompt, context, state):
+            yield token
+
+async def _generate(prompt, context=None, backend=None):
+    backend = backend or llm_router.pick()
+    if backend is None:
+        raise NoBackendAvailable("No LLM backend available")
     full_response = ""
-    for line in response.iter_lines():
-        if line:
-            try:
-                obj = json.loads(line.decode("utf-8"))
-                if "response" in obj:
-                    full_response += obj["response"]
-            except json.JSONDecodeError:
-                continue
-
-    logger.info("Full Ollama Response:\n%s", full_response)
-    return extract_cli_block(full_response) if full_response else "No response generated."
-	
-	
\ No newline at end of file
+    state = {}
+    async for token in _stream_backend(backend, prompt, context, state):
+        full_response += token
+    if "prompt_eval_count" in state:
+        logger.info(f"{backend.name} prefilled {state['prompt_eval_count']} prompt tokens")
+    return full_response
+
+class SingleFlight:
+    # Concurrent calls with the same key share one in-flight task. Each
+    # caller awaits it through a shield, so one caller giving up (client
+    # disconnect) does not cancel it for the others; the task is cancelled
+    # only when its last waiter leaves.
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, factory):
+        self.calls += 1
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = self._inflight[key] = {"task": asyncio.ensure_future(factory()), "waiters": 0}
+            entry["task"].add_done_callback(lambda _: self._forget(key, entry))
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced onto in-flight generation {key[:12]}")
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                self._forget(key, entry)
+                entry["task"].cancel()
+
+    def _forget(self, key, entry):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+generation_flights = SingleFlight()
+
+def prompt_key(prompt, context=None, route=""):
+    return hashlib.sha256(f"{route}\0{prompt}\0{context or ''}".encode("utf-8")).hexdigest()
+
+async def call_ollama(prompt, timeout=None, context=None, vendor=None, feature=None, model=None):
+    # Identical prompts already being generated wait for that result instead
+    # of sending another request to Ollama
+    route = ",".join(sorted(backend.name for backend in llm_router.candidates(vendor, feature)))
+    return await generation_flights.do(
+        prompt_key(prompt, context, route),
+        lambda: _call_validated(prompt, timeout, context, vendor, feature, model)
+    )
+
+async def _call_validated(prompt, timeout=None, context=None, vendor=None, feature=None, model=None):
+    # A config that fails the syntax check is regenerated with the problems
+    # listed after the request, up to VALIDATION_RETRIES times, then becomes
+    # an error like an unreachable backend
+    result = await _call_ollama(prompt, timeout, context, vendor, feature)
+    attempt = 0
+    while VALIDATION_MODE != "off" and not generation_failed(result):
+        problems = validate_config(result, vendor, model)
+        if not problems:
+            return result
+        if VALIDATION_MODE == "warn":
+            logger.warning(f"Generated config failed validation, kept: {'; '.join(problems[:5])}")
+            return result
+        if attempt >= VALIDATION_RETRIES:
+            logger.warning(f"Generated config failed validation after {attempt} regenerations: {'; '.join(problems[:5])}")
+            return validation_error(problems)
+        attempt += 1
+        logger.info(f"Generated config failed validation, regenerating ({attempt}/{VALIDATION_RETRIES}): {'; '.join(problems[:5])}")
+        result = await _call_ollama(prompt + repair_section(problems), timeout, context, vendor, feature)
+    return result
+
+async def _call_ollama(prompt, timeout=None, context=None, vendor=None, feature=None):
+    # The timeout is one deadline for the whole call, failover included
+    timeout = timeout or OLLAMA_TIMEOUT
+    deadline = time.monotonic() + timeout
+    result = "Error: Unable to reach Ollama."
+    tried = set()
+    for _ in range(LLM_MAX_ATTEMPTS):
+        remaining = deadline - time.monotonic()
+        backend = llm_router.pick(vendor, feature, exclude=tried)
+        if backend is None or remaining <= 0:
+            break
+        tried.add(backend.name)
+        try:
+            async with backend.track():
+                full_response = await asyncio.wait_for(_generate(prompt, context, backend), remaining)
+        except httpx.HTTPError as e:
+            logger.error(f"Ollama request to {backend.name} failed: {e}")
+            result = "Error: Unable to reach Ollama."
+            continue
+        except asyncio.TimeoutError:
+            logger.error(f"Ollama request to {backend.name} exceeded the {timeout}s deadline")
+            result = "Error: Ollama request timed out."
+            continue
+
+        log_body(logger, f"Ollama response from {backend.name}", full_response)
+        return extract_cli_block(full_response) if full_response else "No response generated."
+    if not tried:
+        logger.error("No LLM backend available, all circuits are open")
+    return result
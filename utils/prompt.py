@@ -0,0 +1,150 @@
+#prompt.py
+
+import logging
+import os
+import re
+
+logger = logging.getLogger("rag_api")
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("NOA_PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_DEDUPE_THRESHOLD = float(os.getenv("NOA_PROMPT_DEDUPE_THRESHOLD", "0.85"))
+TIKTOKEN_ENCODING = os.getenv("NOA_TIKTOKEN_ENCODING", "cl100k_base")
+
+# tiktoken is optional and not Mistral's tokenizer anyway, the budget only
+# needs a fast estimate. Without it, words and punctuation are counted with
+# long words split roughly the way BPE vocabularies split them.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+        except Exception as e:
+            logger.info(f"tiktoken unavailable ({e}), estimating prompt tokens heuristically")
+    return _encoding
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(1 + len(token) // 8 for token in _TOKEN_RE.findall(text))
+
+def _example_text(entry):
+    return entry[5]
+
+def _example_score(entry):
+    # Weighted retrieval rows carry their decayed feedback score, library
+    # rows do not and keep their retrieval order
+    if hasattr(entry, "keys") and "feedback_score" in entry.keys():
+        return entry["feedback_score"] or 0.0
+    return 0.0
+
+def _shingles(text):
+    return {" ".join(line.lower().split()) for line in text.splitlines() if line.strip()}
+
+def _near_duplicate(shingles, kept):
+    for other in kept:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= PROMPT_DEDUPE_THRESHOLD:
+            return True
+    return False
+
+def _truncate_lines(text, budget):
+    lines = []
+    used = 0
+    for line in text.splitlines():
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+def pack_examples(entries, budget):
+    # Ranks by feedback score then retrieval rank, drops blocks that are
+    # near-identical to one already chosen, and keeps adding examples while
+    # they fit the budget. Smaller examples further down may still fit after
+    # a large one is skipped. If not even the best example fits it is cut at
+    # a line boundary, a prompt without examples is worse than a short one.
+    ranked = sorted(enumerate(entries), key=lambda item: (-_example_score(item[1]), item[0]))
+    examples = []
+    kept = []
+    stats = {"candidates": len(entries), "duplicates": 0, "over_budget": 0, "tokens": 0}
+    for _, entry in ranked:
+        text = _example_text(entry)
+        if not text or not text.strip():
+            continue
+        shingles = _shingles(text)
+        if _near_duplicate(shingles, kept):
+            stats["duplicates"] += 1
+            continue
+        cost = count_tokens(text) + 2
+        if stats["tokens"] + cost > budget:
+            stats["over_budget"] += 1
+            continue
+        examples.append(text)
+        kept.append(shingles)
+        stats["tokens"] += cost
+    if not examples and ranked and budget > 0:
+        text = _truncate_lines(_example_text(ranked[0][1]) or "", budget)
+        if text:
+            examples.append(text)
+            stats["tokens"] = count_tokens(text)
+            stats["over_budget"] -= 1
+    stats["used"] = len(examples)
+    return examples, stats
+
+# Layout for Ollama's prompt cache: the runner keeps the KV cache of the last
+# prompt and only prefills from the first token that differs. Everything that
+# is the same for a vendor/feature goes first, in a fixed order, and only the
+# request block at the end changes between requests.
+SYSTEM_INSTRUCTION = (
+    "You are a network assistant. Based on the CLI examples below, generate the "
+    "configuration requested at the end. Respond only with the CLI configuration "
+    "block using triple backticks.\n"
+)
+
+def examples_section(request, examples):
+    # Sorted by content rather than retrieval rank, which moves with feedback
+    header = f"CLI examples for {request.vendor.strip().lower()} {request.feature.strip().lower()}:\n"
+    return header + "\n\n".join(sorted(examples)) + "\n"
+
+def request_section(request):
+    return f"""Generate a configuration for:
+- Vendor: {request.vendor}
+- Model: {request.model}
+- OS Version: {request.os_version}
+- Feature: {request.feature}
+- Parameters: {request.parameters}
+"""
+
+def repair_section(problems):
+    # Appended after the request for a regeneration, the prefix stays cached
+    listed = "\n".join(f"- {problem}" for problem in problems[:10])
+    return f"""
+The previous answer failed the syntax check:
+{listed}
+Fix these and respond only with the corrected CLI configuration block using triple backticks.
+"""
+
+def layout_prompt(request, examples):
+    return "\n".join([SYSTEM_INSTRUCTION, examples_section(request, examples), request_section(request)])
+
+# Logged prompts are kept as this reference rather than the rendered text,
+# utils.ollama.feedback_prompt rebuilds them
+REFERENCE_FIELDS = ("vendor", "model", "os_version", "feature", "parameters")
+
+def _example_table(entry):
+    return "cli_library" if hasattr(entry, "keys") and "cli_block" in entry.keys() else "staging_queue"
+
+def prompt_reference(entries, request, token_budget=None):
+    return {
+        "examples": [[_example_table(entry), entry[0]] for entry in entries],
+        "request": {field: getattr(request, field) for field in REFERENCE_FIELDS},
+        "budget": token_budget or PROMPT_TOKEN_BUDGET
+    }
@@ -0,0 +1,159 @@
+#push_engine.py
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from models.config_request import ConfigRequest
+from utils.database import STAGING_ROWS_SQL, get_connection, log_feedback
+from utils.device import get_device_type, push_config
+from utils.metrics import DB_WRITE_SECONDS
+from utils.prompt import prompt_reference
+
+logger = logging.getLogger("rag_api")
+
+PUSH_WORKERS = int(os.getenv("NOA_PUSH_WORKERS", "50"))
+VENDOR_DEFAULT_LIMIT = int(os.getenv("NOA_PUSH_VENDOR_LIMIT", "10"))
+
+def parse_vendor_limits(spec):
+    # "cisco_nxos=20,fortinet=5" -> {"cisco_nxos": 20, "fortinet": 5}
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            device_type, limit = item.split("=", 1)
+            limits[device_type.strip()] = int(limit)
+    return limits
+
+VENDOR_LIMITS = parse_vendor_limits(os.getenv("NOA_PUSH_VENDOR_LIMITS", ""))
+# Rows still queued/generating/failed have no config yet, pushed/rejected
+# ones are done. error is a failed push, retried like /push/{id} retries it.
+PUSHABLE_STATUSES = ("pending", "error")
+
+def split_pushable(conn, request_ids):
+    # -> (ids that can be pushed, [(id, device_ip, device_name, reason)] for the rest)
+    placeholders = ", ".join("?" for _ in request_ids)
+    found = {row["id"]: row for row in conn.execute(
+        f"SELECT id, status, config_hash, device_ip, device_name FROM staging_queue WHERE id IN ({placeholders})",
+        list(request_ids)
+    ).fetchall()}
+    pushable, skipped = [], []
+    for request_id in dict.fromkeys(request_ids):
+        row = found.get(request_id)
+        if row is None:
+            skipped.append((request_id, None, None, "Unknown request id."))
+        elif row["status"] not in PUSHABLE_STATUSES or row["config_hash"] is None:
+            skipped.append((request_id, row["device_ip"], row["device_name"], f"Not pushable ({row['status']})."))
+        else:
+            pushable.append(request_id)
+    return pushable, skipped
+
+def record_skipped(conn, batch_id, skipped):
+    conn.executemany("""
+        INSERT INTO push_results (batch_id, request_id, device_ip, device_name, status, output, duration)
+        VALUES (?, ?, ?, ?, 'skipped', ?, 0)
+    """, [(batch_id, *item) for item in skipped])
+
+def create_push_batch(request_ids, requested_by, db_path="staging_queue.db"):
+    # Returns the batch id and the request ids to push; the others are
+    # recorded as skipped results straight away
+    conn = get_connection(db_path)
+    pushable, skipped = split_pushable(conn, request_ids)
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO push_batches (requested_by, status, total) VALUES (?, 'queued', ?)",
+            (requested_by, len(pushable))
+        )
+        record_skipped(conn, cursor.lastrowid, skipped)
+    if skipped:
+        logger.warning(f"Push batch #{cursor.lastrowid}: skipped {[item[0] for item in skipped]}")
+    return cursor.lastrowid, pushable
+
+def get_push_batch(batch_id, db_path="staging_queue.db"):
+    conn = get_connection(db_path)
+    batch = conn.execute("SELECT * FROM push_batches WHERE id = ?", (batch_id,)).fetchone()
+    if not batch:
+        return None
+    results = conn.execute("""
+        SELECT request_id, device_ip, device_name, status, output, duration, finished_at
+        FROM push_results WHERE batch_id = ? ORDER BY id
+    """, (batch_id,)).fetchall()
+    return {**dict(batch), "results": [dict(row) for row in results]}
+
+@DB_WRITE_SECONDS.time(op="record_push_result")
+def record_push_result(batch_id, row, success, output, duration, db_path="staging_queue.db"):
+    new_status = "pushed" if success else "error"
+    prompt = prompt_reference([row], ConfigRequest(**row))
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("""
+            INSERT INTO push_results (batch_id, request_id, device_ip, device_name, status, output, duration)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (batch_id, row["id"], row["device_ip"], row["device_name"], new_status, output, duration))
+        log_feedback(row["id"], new_status, prompt, row["generated_config"], db_path, commit=False)
+        conn.execute("UPDATE staging_queue SET status = ? WHERE id = ?", (new_status, row["id"]))
+        conn.execute("""
+            UPDATE push_batches
+            SET done = done + 1, succeeded = succeeded + ?, failed = failed + ?
+            WHERE id = ?
+        """, (int(success), int(not success), batch_id))
+
+def run_push_batch(batch_id, request_ids, username, password, db_path="staging_queue.db",
+                   workers=PUSH_WORKERS, vendor_limits=None, timeout=None, progress=None):
+    # Each device type gets its own pool sized to its concurrency limit, so a
+    # slow vendor never holds worker threads that another vendor could use.
+    # The global semaphore caps the total number of open SSH sessions.
+    # Checked again here: a row can change between queueing and running
+    conn = get_connection(db_path)
+    pushable, skipped = split_pushable(conn, request_ids) if request_ids else ([], [])
+    placeholders = ", ".join("?" for _ in pushable)
+    rows = conn.execute(f"{STAGING_ROWS_SQL} WHERE sq.id IN ({placeholders})", pushable).fetchall() if pushable else []
+    with conn:
+        conn.execute("UPDATE push_batches SET status = 'running', total = ? WHERE id = ?", (len(rows), batch_id))
+        record_skipped(conn, batch_id, skipped)
+    if skipped:
+        logger.warning(f"Push batch #{batch_id}: skipped {[item[0] for item in skipped]}")
+
+    limits = {**VENDOR_LIMITS, **(vendor_limits or {})}
+    session_slots = threading.BoundedSemaphore(workers)
+    pools = {}
+
+    def push_one(row):
+        with session_slots:
+            start = time.perf_counter()
+            success, output = push_config(
+                row["device_ip"], username, password, row["generated_config"],
+                row["vendor"], row["model"], row["device_name"], timeout=timeout
+            )
+        duration = time.perf_counter() - start
+        record_push_result(batch_id, row, success, output, duration, db_path)
+        return row["id"], success
+
+    futures = []
+    try:
+        for row in rows:
+            device_type = get_device_type(row["vendor"], row["model"])
+            if device_type not in pools:
+                pools[device_type] = ThreadPoolExecutor(
+                    max_workers=limits.get(device_type, VENDOR_DEFAULT_LIMIT),
+                    thread_name_prefix=f"push-{device_type}"
+                )
+            futures.append(pools[device_type].submit(push_one, row))
+
+        done = 0
+        for future in as_completed(futures):
+            request_id, success = future.result()
+            done += 1
+            logger.info(f"Push batch #{batch_id}: {done}/{len(rows)} (request #{request_id} {'ok' if success else 'failed'})")
+            if progress:
+                progress(done, len(rows), request_id, success)
+    finally:
+        for pool in pools.values():
+            pool.shutdown()
+        with conn:
+            conn.execute(
+                "UPDATE push_batches SET status = 'finished', finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (batch_id,)
+            )
+    return get_push_batch(batch_id, db_path)
@@ -1,16 +1,44 @@
 #query.py
 
-import sqlite3
-import difflib
 import logging
+import os
+
+from utils.database import decay_exponent, get_connection
+from utils.metadata_index import get_metadata_index
+from utils.metrics import RETRIEVAL_SECONDS
+from utils.vector_index import get_index
 
 logger = logging.getLogger("rag_api")
 
+SEMANTIC_TOP_K = int(os.getenv("NOA_SEMANTIC_TOP_K", "5"))
+SEMANTIC_MIN_SCORE = float(os.getenv("NOA_SEMANTIC_MIN_SCORE", "0.1"))
+WEIGHTED_TOP_K = int(os.getenv("NOA_WEIGHTED_TOP_K", "10"))
+
+# Served by idx_cli_library_normalized / idx_staging_queue_normalized and
+# idx_feedback_log_request, see utils/migrations.py
+EXACT_ENTRIES_SQL = """
+    SELECT * FROM cli_library
+    WHERE vendor_n = ? AND model_n = ? AND os_n = ? AND feature_n = ?
+"""
+# One row per distinct config (same text, same blob hash): SQLite returns the bare sq.* columns of the
+# row holding MAX(log_score) within each group
+WEIGHTED_ENTRIES_SQL = """
+    SELECT sq.*, decayed_score(MAX(fs.log_score), ?) AS feedback_score
+    FROM staging_queue sq
+    LEFT JOIN feedback_score fs ON fs.request_id = sq.id
+    WHERE sq.vendor_n = ? AND sq.model_n = ? AND sq.os_n = ? AND sq.feature_n = ?
+      AND sq.config_hash IS NOT NULL
+    GROUP BY sq.config_hash
+    ORDER BY feedback_score DESC, sq.id DESC
+    LIMIT ?
+"""
+
 def normalize(text: str) -> str:
     return text.strip().lower()
 
+@RETRIEVAL_SECONDS.time(source="library")
 def query_entries(vendor, model, os_version, feature, db_path="cli_library.db"):
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
 
     vendor = normalize(vendor)
@@ -20,99 +48,62 @@ def query_entries(vendor, model, os_version, feature, db_path="cli_library.db"):
 
     logger.info(f"Querying CLI examples for vendor='{vendor}', model='{model}', os_version='{os_version}', feature='{feature_input}'")
 
-    cursor.execute("""
-        SELECT * FROM cli_library
-        WHERE lower(vendor) = ? AND lower(model) = ? AND lower(os_version) = ? AND lower(feature) = ?
-    """, (vendor, model, os_version, feature_input))
+    cursor.execute(EXACT_ENTRIES_SQL, (vendor, model, os_version, feature_input))
     results = cursor.fetchall()
 
     if results:
-        conn.close()
         return results
 
-    # Fuzzy matching fallback
-    cursor.execute("SELECT DISTINCT vendor FROM cli_library")
-    vendors = [row[0].lower() for row in cursor.fetchall()]
-    cursor.execute("SELECT DISTINCT model FROM cli_library")
-    models = [row[0].lower() for row in cursor.fetchall()]
-    cursor.execute("SELECT DISTINCT os_version FROM cli_library")
-    os_versions = [row[0].lower() for row in cursor.fetchall()]
-    cursor.execute("SELECT DISTINCT feature FROM cli_library")
-    features = [row[0] for row in cursor.fetchall()]
-
-    best_vendor = difflib.get_close_matches(vendor, vendors, n=1)
-    best_model = difflib.get_close_matches(model, models, n=1)
-    best_os_version = difflib.get_close_matches(os_version, os_versions, n=1)
-
-    feature_map = {f: f.split('_')[-1].lower() for f in features}
-    stripped_features = list(feature_map.values())
-    best_feature_match = difflib.get_close_matches(feature_input, stripped_features, n=1)
-
-    best_feature = []
-    if best_feature_match:
-        for full, stripped in feature_map.items():
-            if stripped == best_feature_match[0]:
-                best_feature = [full]
-                break
-
-    logger.info("Fuzzy match candidates:")
-    logger.info(f"Vendor match: {best_vendor}")
-    logger.info(f"Model match: {best_model}")
-    logger.info(f"OS version match: {best_os_version}")
-    logger.info(f"Feature match: {best_feature}")
+    # Resolve against the resident metadata index, no DB round-trips
+    best_vendor, best_model, best_os_version, best_feature = get_metadata_index(db_path).resolve(
+        vendor, model, os_version, feature_input
+    )
+    logger.info(f"Metadata match: vendor={best_vendor} model={best_model} os_version={best_os_version} feature={best_feature}")
 
     if best_vendor and best_model and best_os_version and best_feature:
-        fuzzy_vendor = best_vendor[0]
-        fuzzy_model = best_model[0]
-        fuzzy_os_version = best_os_version[0]
-        fuzzy_feature = best_feature[0]
-        cursor.execute("""
-            SELECT * FROM cli_library
-            WHERE lower(vendor) = ? AND lower(model) = ? AND lower(os_version) = ? AND feature = ?
-        """, (fuzzy_vendor, fuzzy_model, fuzzy_os_version, fuzzy_feature))
+        cursor.execute(EXACT_ENTRIES_SQL, (
+            normalize(best_vendor), normalize(best_model), normalize(best_os_version), normalize(best_feature)
+        ))
         results = cursor.fetchall()
 
-    if not results and best_vendor and best_feature:
-        fuzzy_vendor = best_vendor[0]
-        fuzzy_feature = best_feature[0]
-        cursor.execute("""
-            SELECT * FROM cli_library
-            WHERE lower(vendor) = ? AND feature LIKE ?
-        """, (fuzzy_vendor, f"%{fuzzy_feature}%"))
-        results = cursor.fetchall()
+    if results:
+        return results
 
-    if not results and best_feature:
-        fuzzy_feature = best_feature[0]
-        cursor.execute("""
-            SELECT * FROM cli_library
-            WHERE feature LIKE ?
-        """, (f"%{fuzzy_feature}%",))
-        results = cursor.fetchall()
+    # Semantic fallback over the precomputed vector index
+    index = get_index(db_path)
+    query_text = f"{vendor} {model} {os_version} {feature_input}"
+    # A resolved feature bounds the search: examples of another feature of
+    # the same vendor only mislead the model. Unscoped only when the feature
+    # is unknown to the library.
+    if best_feature:
+        scopes = [{"vendor": best_vendor, "feature": best_feature}] if best_vendor else []
+        scopes.append({"feature": best_feature})
+    else:
+        scopes = [{"vendor": best_vendor}] if best_vendor else []
+        scopes.append({})
+    matches = []
+    for scope in scopes:
+        matches = index.search([query_text], k=SEMANTIC_TOP_K, min_score=SEMANTIC_MIN_SCORE, **scope)[0]
+        if matches:
+            break
+    logger.info(f"Semantic match candidates: {matches}")
+
+    if matches:
+        ids = [match_id for match_id, _ in matches]
+        placeholders = ", ".join("?" for _ in ids)
+        cursor.execute(f"SELECT * FROM cli_library WHERE id IN ({placeholders})", ids)
+        by_id = {row[0]: row for row in cursor.fetchall()}
+        results = [by_id[match_id] for match_id in ids if match_id in by_id]
 
-    conn.close()
     return results
-    
-    
-from utils.database import score_feedback
-
-def score_feedback(status):
-    return {
-        "pushed": 3,
-        "pending": 2,
-        "rejected": 1,
-        "error": 0
-    }.get(status, 0)
-
-def query_weighted_entries(vendor, model, os_version, feature, db_path="staging_queue.db"):
-    conn = sqlite3.connect(db_path)
+
+@RETRIEVAL_SECONDS.time(source="weighted")
+def query_weighted_entries(vendor, model, os_version, feature, db_path="staging_queue.db", limit=WEIGHTED_TOP_K):
+    conn = get_connection(db_path)
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT sq.*, fl.status
-        FROM staging_queue sq
-        LEFT JOIN feedback_log fl ON sq.id = fl.request_id
-        WHERE lower(sq.vendor) = ? AND lower(sq.model) = ? AND lower(sq.os_version) = ? AND lower(sq.feature) = ?
-    """, (normalize(vendor), normalize(model), normalize(os_version), normalize(feature)))
-    results = cursor.fetchall()
-    conn.close()
-    scored = sorted(results, key=lambda r: score_feedback(r[-1]), reverse=True)
-    return scored
\ No newline at end of file
+    cursor.execute(WEIGHTED_ENTRIES_SQL, (
+        decay_exponent(),
+        normalize(vendor), normalize(model), normalize(os_version), normalize(feature),
+        limit
+    ))
+    return cursor.fetchall()
\ No newline at end of file
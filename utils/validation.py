@@ -0,0 +1,350 @@
+#validation.py
+
+import logging
+import os
+import re
+import time
+
+from utils.cli_blocks import CLI_EXTENSIONS, iter_blocks
+from utils.device import get_device_type
+from utils.metrics import CONFIG_VALIDATION, CONFIG_VALIDATION_SECONDS
+
+logger = logging.getLogger("rag_api")
+
+# Local syntax check of generated configs, run before they are cached, staged
+# or shown: a bad block is caught in well under a millisecond instead of on
+# the device. enforce turns problems into a generation error (after
+# NOA_VALIDATION_RETRIES regenerations), warn only logs them. warn is the
+# default; run tooling/check_validation.py after changing the grammars and
+# before turning enforce on.
+VALIDATION_MODE = os.getenv("NOA_CONFIG_VALIDATION", "warn").lower()
+VALIDATION_RETRIES = int(os.getenv("NOA_VALIDATION_RETRIES", "1"))
+CLI_FILES_DIR = os.getenv("NOA_CLI_FILES_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cli_files"))
+EXTRA_COMMANDS = {word.strip().lower() for word in os.getenv("NOA_VALIDATION_EXTRA_COMMANDS", "").split(",") if word.strip()}
+
+# netmiko device type -> grammar family
+FAMILIES = {
+    "cisco_ios": "cisco",
+    "cisco_nxos": "cisco",
+    "aruba_os": "aruba",
+    "fortinet": "fortios",
+    "hp_comware": "comware",
+}
+
+# Commands the cli_files/ examples do not happen to show; the first words of
+# every line under cli_files/ are added per family when the grammars load
+BASE_COMMANDS = {
+    "cisco": """
+        aaa access-list address-family archive area authentication bandwidth banner bfd boot callhome cdp
+        channel-group class-map clock conf configure control-plane copy crypto default default-information
+        delay description dot1x duplex enable encapsulation end errdisable exit feature hostname hsrp
+        interface ip ipv6 key lacp license line lldp load-interval logging login mab mac media-type mls
+        monitor mtu name neighbor network ntp object-group passive-interface password platform
+        policy-map port-channel power privilege qos radius radius-server redistribute remote-as
+        route-map router router-id service service-policy shutdown snmp-server spanning-tree speed ssh
+        standby storm-control switchport system tacacs tacacs-server timers track transport udld
+        username version vlan vpc vrf vrrp vtp write
+    """,
+    "aruba": """
+        aaa access-list banner configure console crypto description disable dhcp-snooping duplex enable exit hostname
+        interface ip ipv6 lacp lldp logging loop-protect mirror name no ntp password power-over-ethernet
+        qos radius-server router shutdown snmp-server spanning-tree speed-duplex tagged timesync trunk
+        untagged vlan voice write
+    """,
+    "fortios": """
+        abort append clone config delete diagnose edit end execute get move next purge rename select
+        set show unselect unset
+    """,
+    "comware": """
+        acl area bgp description display dot1x duplex hotkey info-center interface ip ipv6 lacp link-aggregation
+        lldp local-user mac-address mtu network ntp-service ospf packet-filter password peer port preference quit
+        return router-id save shutdown snmp-agent speed ssh stp system-view sysname telnet undo
+        user-interface vlan
+    """,
+}
+
+# Mode tracking goes by command words, the device ignores indentation.
+# ENTER starts configuration mode, OPENERS start a sub-mode from anywhere in
+# it (leaving the current one), NESTED start a sub-mode inside the given
+# parent. CLOSERS leave one sub-mode, or configuration mode when none is
+# open; LEAVERS leave configuration mode. After that only EXEC commands fit.
+# Ambiguous commands count as openers: an extra open mode can only hide a
+# problem, not report one that is not there.
+ENTER = {"cisco": {"configure", "conf"}, "aruba": {"configure"}, "comware": {"system-view"}}
+OPENERS = {
+    "cisco": {
+        "interface", "vlan", "router", "line", "vrf context", "vrf definition", "route-map", "policy-map",
+        "class-map", "object-group", "ip access-list", "ipv6 access-list", "vpc domain", "key chain"
+    },
+    "aruba": {
+        "vlan", "interface", "router", "radius-server host", "aaa server-group", "ip access-list",
+        "ipv6 access-list", "access-list ip", "access-list ipv6", "access-list mac"
+    },
+    "comware": {
+        "vlan", "interface", "ospf", "bgp", "rip", "isis", "acl", "user-interface", "line", "local-user",
+        "domain", "ip vpn-instance", "radius scheme", "hwtacacs scheme"
+    },
+}
+NESTED = {
+    "cisco": {
+        "router": {"address-family", "neighbor", "vrf", "template"},
+        "neighbor": {"address-family"},
+        "vrf": {"address-family", "neighbor"},
+        "vrf context": {"address-family"},
+        "policy-map": {"class"},
+    },
+    "aruba": {"router": {"area"}},
+    "comware": {"ospf": {"area"}, "bgp": {"address-family", "ipv4-family", "ipv6-family"}},
+}
+CLOSERS = {"cisco": {"exit"}, "aruba": {"exit"}, "comware": {"quit"}}
+LEAVERS = {"cisco": {"end"}, "aruba": {"end"}, "comware": {"return"}}
+EXEC = {"cisco": {"copy", "write", "show"}, "aruba": {"copy", "write", "show"}, "comware": {"save", "display"}}
+# Commands only valid inside a sub-mode, by the command that opened it
+SUBMODE_COMMANDS = {
+    "cisco": {
+        "ip access-list": "permit deny remark statistics",
+        "ipv6 access-list": "permit deny remark statistics",
+        "object-group": "host range group-object",
+        "line": "access-class exec exec-timeout history length login privilege session-timeout stopbits width",
+        "class-map": "match",
+        "policy-map": "class",
+        "class": "police priority queue-limit random-detect set shape",
+        "route-map": "continue match set",
+        "vrf context": "rd",
+        "key chain": "accept-lifetime key-string send-lifetime",
+    },
+    "aruba": {
+        "ip access-list": "permit deny remark",
+        "ipv6 access-list": "permit deny remark",
+        "access-list ip": "permit deny remark",
+        "access-list ipv6": "permit deny remark",
+        "access-list mac": "permit deny remark",
+    },
+    "comware": {
+        "acl": "rule step",
+        "user-interface": "authentication-mode idle-timeout protocol user-role",
+        "line": "authentication-mode idle-timeout protocol user-role",
+    },
+}
+SUBMODE_COMMANDS = {
+    family: {mode: set(words.split()) for mode, words in modes.items()}
+    for family, modes in SUBMODE_COMMANDS.items()
+}
+# Sub-modes whose entries may start with a sequence number (10 permit ...)
+SEQUENCED = {
+    "cisco": {"ip access-list", "ipv6 access-list", "object-group"},
+    "aruba": {"ip access-list", "ipv6 access-list", "access-list ip", "access-list ipv6", "access-list mac"},
+}
+NEGATIONS = {"no", "undo"}
+COMMENTS = ("!", "#")
+
+_IPV4_RE = re.compile(r"^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})(?:/(\d{1,3}))?$")
+_VLAN_LIST_RE = re.compile(r"^\d+(?:-\d+)?(?:,\d+(?:-\d+)?)*$")
+_VLAN_NAME_RE = re.compile(r"^vlan(?:-interface)?(\d+)$", re.IGNORECASE)
+_VLAN_KEYWORDS = {"vlan", "vlanid"}
+
+_grammars = None
+
+def family_for(vendor, model):
+    return FAMILIES.get(get_device_type(vendor or "", model or ""))
+
+def _first_word(line):
+    words = line.split()
+    if words and words[0].lower() in NEGATIONS and len(words) > 1:
+        return words[1].lower()
+    return words[0].lower() if words else ""
+
+def load_grammars(cli_dir=None):
+    # Known command words per family: the base list plus whatever the
+    # reference blocks under cli_files/ use
+    grammars = {family: set(words.split()) | EXTRA_COMMANDS for family, words in BASE_COMMANDS.items()}
+    cli_dir = cli_dir or CLI_FILES_DIR
+    if os.path.isdir(cli_dir):
+        for name in sorted(os.listdir(cli_dir)):
+            if not name.endswith(CLI_EXTENSIONS):
+                continue
+            for vendor, model, _, _, block, _, _ in iter_blocks(os.path.join(cli_dir, name)):
+                family = family_for(vendor, model)
+                if family:
+                    grammars[family].update(_first_word(line) for line in block.splitlines() if line.strip())
+    grammars = {family: words - {""} for family, words in grammars.items()}
+    logger.info(f"Config grammars loaded: {', '.join(f'{family} {len(words)} commands' for family, words in sorted(grammars.items()))}")
+    return grammars
+
+def get_grammars():
+    global _grammars
+    if _grammars is None:
+        _grammars = load_grammars()
+    return _grammars
+
+def _ipv4(token):
+    match = _IPV4_RE.match(token)
+    if not match:
+        return None
+    octets = [int(part) for part in match.groups()[:4]]
+    if any(octet > 255 for octet in octets):
+        return False
+    prefix = match.group(5)
+    if prefix is not None and int(prefix) > 32:
+        return False
+    return (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+
+def _contiguous(value):
+    # value + 1 is a power of two: 0...01...1
+    return value & (value + 1) == 0
+
+def check_parameters(words):
+    problems = []
+    previous_address = False
+    for index, word in enumerate(words):
+        token = word.strip('"')
+        address = _ipv4(token)
+        if address is False:
+            problems.append(f"invalid IPv4 address or prefix '{token}'")
+        elif address is not None and previous_address and "/" not in token:
+            # The word after an address is a mask (255.x) or a wildcard (0.x)
+            if token.startswith("255.") and not _contiguous(~address & 0xFFFFFFFF):
+                problems.append(f"non-contiguous subnet mask '{token}'")
+            elif token.startswith("0.") and address and not _contiguous(address):
+                problems.append(f"non-contiguous wildcard mask '{token}'")
+        previous_address = address not in (None, False)
+
+        lowered = token.lower()
+        vlans = []
+        if lowered in _VLAN_KEYWORDS and index + 1 < len(words) and _VLAN_LIST_RE.match(words[index + 1]):
+            for item in words[index + 1].split(","):
+                vlans.extend(int(bound) for bound in item.split("-"))
+        elif index > 0 and words[index - 1].lower() == "interface" and _VLAN_NAME_RE.match(token):
+            vlans.append(int(_VLAN_NAME_RE.match(token).group(1)))
+        problems.extend(f"VLAN id {vlan} outside 1-4094" for vlan in vlans if not 1 <= vlan <= 4094)
+    if words and words[0].lower() == "interface" and not any(char.isdigit() for char in " ".join(words[1:])):
+        problems.append("interface without a name or number")
+    return problems
+
+def _check_fortios(lines, problems):
+    # config/edit/next/end nest strictly
+    stack = []
+    for lineno, words in lines:
+        command = words[0].lower()
+        if command == "config":
+            if stack and stack[-1][0] == "config":
+                problems.append(f"line {lineno}: 'config' directly inside another config, expected 'edit'")
+            stack.append(("config", lineno))
+        elif command == "edit":
+            if not stack or stack[-1][0] != "config":
+                problems.append(f"line {lineno}: 'edit' outside a config block")
+            stack.append(("edit", lineno))
+        elif command == "next":
+            if not stack or stack[-1][0] != "edit":
+                problems.append(f"line {lineno}: 'next' without an open edit")
+            else:
+                stack.pop()
+        elif command == "end":
+            if stack and stack[-1][0] == "edit":
+                problems.append(f"line {lineno}: 'end' closes the edit from line {stack[-1][1]} without 'next'")
+                stack.pop()
+            if not stack:
+                problems.append(f"line {lineno}: 'end' without an open config")
+            else:
+                stack.pop()
+        elif command in ("set", "unset", "append", "select", "unselect") and not stack:
+            problems.append(f"line {lineno}: '{command}' outside a config block")
+    for kind, lineno in reversed(stack):
+        problems.append(f"line {lineno}: '{kind}' is never closed with '{'next' if kind == 'edit' else 'end'}'")
+
+def _mode_key(words, openers):
+    two = " ".join(words[:2]).lower()
+    return two if two in openers else words[0].lower()
+
+def _check_modes(family, lines, problems):
+    # Structural problems are the ones that change where the following lines
+    # land: a closer or leaver that drops out of configuration mode before
+    # more configuration lines. A trailing exit/quit/end is harmless.
+    # Returns the sub-modes open at each line, for the command word check.
+    openers = OPENERS[family]
+    nested = NESTED[family]
+    in_config = True
+    stack = []
+    left_at = None
+    modes = {}
+    for lineno, words in lines:
+        modes[lineno] = tuple(stack)
+        command = words[0].lower()
+        single = len(words) == 1
+        if command in ENTER[family]:
+            in_config, stack = True, []
+        elif not in_config:
+            if command not in EXEC[family]:
+                problems.append(f"line {lineno}: '{command}' after line {left_at} left configuration mode")
+        elif command in CLOSERS[family] and single:
+            if stack:
+                stack.pop()
+            else:
+                in_config, left_at = False, lineno
+        elif command in LEAVERS[family] and single:
+            in_config, stack, left_at = False, [], lineno
+        elif command not in NEGATIONS:
+            key = _mode_key(words, set(openers) | {child for children in nested.values() for child in children})
+            for depth in range(len(stack) - 1, -1, -1):
+                if key in nested.get(stack[depth], ()):
+                    del stack[depth + 1:]
+                    stack.append(key)
+                    break
+            else:
+                if key in openers:
+                    stack = [key]
+    return modes
+
+def _command_word(words, modes, family):
+    # ACL entries may carry a sequence number before the command
+    if len(words) > 1 and words[0].isdigit() and modes and modes[-1] in SEQUENCED.get(family, ()):
+        words = words[1:]
+    if words[0].lower() in NEGATIONS and len(words) > 1:
+        return words[1].lower()
+    return words[0].lower()
+
+def validate_config(text, vendor, model):
+    # Returns the problems found, empty when the config passes or the device
+    # has no grammar (autodetected types)
+    family = family_for(vendor, model)
+    if family is None:
+        return []
+    start = time.perf_counter()
+    problems = []
+    lines = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(COMMENTS):
+            continue
+        if "```" in stripped:
+            problems.append(f"line {lineno}: stray code fence")
+            continue
+        if stripped.count('"') % 2:
+            problems.append(f"line {lineno}: unbalanced quotes")
+        lines.append((lineno, stripped.split()))
+    if not lines:
+        problems.append("empty configuration")
+
+    if family == "fortios":
+        modes = {}
+        _check_fortios(lines, problems)
+    else:
+        modes = _check_modes(family, lines, problems)
+
+    known = get_grammars()[family]
+    submodes = SUBMODE_COMMANDS.get(family, {})
+    for lineno, words in lines:
+        open_modes = modes.get(lineno, ())
+        first = _command_word(words, open_modes, family)
+        if first not in known and not any(first in submodes.get(mode, ()) for mode in open_modes):
+            problems.append(f"line {lineno}: unknown command '{first}' for {family}")
+        problems.extend(f"line {lineno}: {problem}" for problem in check_parameters(words))
+
+    CONFIG_VALIDATION_SECONDS.observe(time.perf_counter() - start, family=family)
+    CONFIG_VALIDATION.inc(family=family, result="invalid" if problems else "valid")
+    return problems
+
+def validation_error(problems):
+    shown = "; ".join(problems[:5])
+    more = f" (+{len(problems) - 5} more)" if len(problems) > 5 else ""
+    return f"Error: Generated config failed validation: {shown}{more}"
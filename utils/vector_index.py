@@ -0,0 +1,219 @@
+#vector_index.py
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from utils.database import get_connection
+
+logger = logging.getLogger("rag_api")
+
+INDEX_PATH = os.getenv("NOA_INDEX_PATH")
+INDEX_DIM = int(os.getenv("NOA_INDEX_DIM", "1024"))
+METADATA_WEIGHT = 3.0
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def index_path_for(db_path):
+    return INDEX_PATH or os.path.splitext(db_path)[0] + "_index.npz"
+
+@lru_cache(maxsize=1 << 18)
+def _hash(token, dim):
+    return zlib.crc32(token.encode("utf-8")) % dim
+
+def _trigrams(word):
+    padded = f" {word} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+@lru_cache(maxsize=4096)
+def _metadata_terms(fields):
+    terms = []
+    for field in fields:
+        for word in TOKEN_RE.findall((field or "").lower()):
+            terms.append(word)
+            terms.extend(_trigrams(word))
+    return tuple(terms)
+
+def metadata_terms(*fields):
+    # Every block of a file shares its metadata, so the terms are memoised
+    return _metadata_terms(fields)
+
+def feature_suffix(feature):
+    return (feature or "").split("_")[-1].lower()
+
+def vectorize(weighted_terms, dim=INDEX_DIM):
+    vector = np.zeros(dim, dtype=np.float32)
+    for terms, weight in weighted_terms:
+        if not terms:
+            continue
+        slots = np.fromiter((_hash(term, dim) for term in terms), dtype=np.int64, count=len(terms))
+        counts = np.bincount(slots, minlength=dim)
+        present = counts > 0
+        vector[present] += weight * (1.0 + np.log(counts[present]))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def document_vector(vendor, model, os_version, feature, cli_block, dim=INDEX_DIM):
+    return vectorize([
+        (metadata_terms(vendor, model, os_version, feature, feature_suffix(feature)), METADATA_WEIGHT),
+        (TOKEN_RE.findall((cli_block or "").lower()), 1.0)
+    ], dim)
+
+def query_vector(text, dim=INDEX_DIM):
+    return vectorize([(metadata_terms(text), 1.0)], dim)
+
+class VectorIndex:
+    # Hashed term vectors, L2-normalised per block. Document frequencies are
+    # kept alongside so IDF can be applied on the query side, which lets new
+    # blocks be appended without re-weighting the whole matrix. The matrix is
+    # column-major so a query only touches the columns of its own terms.
+    def __init__(self, dim=INDEX_DIM):
+        self.dim = dim
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vendors = np.zeros(0, dtype=object)
+        self.features = np.zeros(0, dtype=object)
+        self.matrix = np.zeros((0, dim), dtype=np.float32, order="F")
+        self.df = np.zeros(dim, dtype=np.float32)
+        # library_identity token of the cli_library the ids belong to
+        self.identity = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def max_id(self):
+        return int(self.ids.max()) if len(self.ids) else 0
+
+    def add(self, rows):
+        if not rows:
+            return
+        vectors = np.vstack([
+            document_vector(vendor, model, os_version, feature, cli_block, self.dim)
+            for _, vendor, model, os_version, feature, cli_block in rows
+        ])
+        self.ids = np.concatenate([self.ids, np.array([row[0] for row in rows], dtype=np.int64)])
+        self.vendors = np.concatenate([self.vendors, np.array([(row[1] or "").strip().lower() for row in rows], dtype=object)])
+        self.features = np.concatenate([self.features, np.array([(row[4] or "").strip().lower() for row in rows], dtype=object)])
+        self.matrix = np.asfortranarray(np.vstack([self.matrix, vectors]))
+        self.df += (vectors > 0).sum(axis=0)
+
+    def remove(self, ids):
+        keep = ~np.isin(self.ids, np.asarray(list(ids), dtype=np.int64))
+        if keep.all():
+            return
+        self.df -= (self.matrix[~keep] > 0).sum(axis=0)
+        self.ids = self.ids[keep]
+        self.vendors = self.vendors[keep]
+        self.features = self.features[keep]
+        self.matrix = np.asfortranarray(self.matrix[keep])
+
+    def idf(self):
+        return np.log((1.0 + len(self.ids)) / (1.0 + self.df)) + 1.0
+
+    def search(self, queries, k=10, vendor=None, feature=None, min_score=0.0):
+        if not len(self.ids) or not queries:
+            return [[] for _ in queries]
+        q = np.vstack([query_vector(text, self.dim) for text in queries]) * self.idf()
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q = q / np.where(norms == 0, 1, norms)
+        terms = np.flatnonzero(q.any(axis=0))
+        scores = q[:, terms] @ self.matrix[:, terms].T
+        if vendor:
+            scores[:, self.vendors != vendor.strip().lower()] = -1.0
+        if feature:
+            scores[:, self.features != feature.strip().lower()] = -1.0
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ranked = candidates[np.argsort(-row[candidates])]
+            results.append([(int(self.ids[i]), float(row[i])) for i in ranked if row[i] > min_score])
+        return results
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path, ids=self.ids, vendors=self.vendors.astype(str), features=self.features.astype(str),
+            matrix=self.matrix, df=self.df, identity=np.array(self.identity or "")
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        if "features" not in data.files:
+            # Saved before blocks carried their feature, rebuilt by the caller
+            return None
+        index = cls(dim=data["matrix"].shape[1])
+        index.ids = data["ids"]
+        index.vendors = data["vendors"].astype(object)
+        index.features = data["features"].astype(object)
+        index.matrix = np.asfortranarray(data["matrix"])
+        index.df = data["df"]
+        index.identity = str(data["identity"]) if "identity" in data.files else None
+        return index
+
+def library_identity(conn):
+    try:
+        row = conn.execute("SELECT token FROM library_identity").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def update_index(db_path="cli_library.db", index_path=None, removed_ids=None):
+    # removed_ids lets the ingester pass its diff instead of a full id scan
+    index_path = index_path or index_path_for(db_path)
+    index = VectorIndex.load(index_path) if os.path.exists(index_path) else None
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    identity = library_identity(conn)
+    rebuilt = index is None or index.identity != identity
+    if rebuilt:
+        # Ids of another library file name other blocks, start over
+        index = VectorIndex()
+        index.identity = identity
+    live_max = cursor.execute("SELECT MAX(id) FROM cli_library").fetchone()[0] or 0
+    if removed_ids is None or live_max < index.max_id:
+        cursor.execute("SELECT id FROM cli_library")
+        live_ids = {row[0] for row in cursor.fetchall()}
+        stale = set(index.ids.tolist()) - live_ids
+    else:
+        stale = set(removed_ids) & set(index.ids.tolist())
+    if stale:
+        index.remove(stale)
+    cursor.execute("""
+        SELECT id, vendor, model, os_version, feature, cli_block FROM cli_library
+        WHERE id > ? ORDER BY id
+    """, (index.max_id,))
+    new_rows = cursor.fetchall()
+    index.add(new_rows)
+    if new_rows or stale or rebuilt:
+        index.save(index_path)
+    logger.info(f"Vector index updated: +{len(new_rows)} -{len(stale)} blocks ({len(index)} total)")
+    return index
+
+_loaded = {}
+_lock = threading.Lock()
+
+def get_index(db_path="cli_library.db", index_path=None):
+    # Rebuilt in another process by parse_cli_file.py, so reload on mtime change
+    index_path = index_path or index_path_for(db_path)
+    with _lock:
+        if not os.path.exists(index_path):
+            index = update_index(db_path, index_path)
+        else:
+            mtime = os.stat(index_path).st_mtime_ns
+            cached = _loaded.get(index_path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            index = VectorIndex.load(index_path)
+            if index is None or index.identity != library_identity(get_connection(db_path)):
+                index = update_index(db_path, index_path)
+        _loaded[index_path] = (os.stat(index_path).st_mtime_ns if os.path.exists(index_path) else 0, index)
+        return index